@@ -13,6 +13,7 @@ from sqlmodel import SQLModel
 from alembic import context
 
 from packages.core import models  # noqa: WPS433
+from packages.db.session import async_url
 
 config = context.config
 fileConfig(config.config_file_name)
@@ -46,7 +47,7 @@ async def run_migrations_online() -> None:
 
     configuration = config.get_section(config.config_ini_section)
     url = os.getenv("DATABASE_URL", configuration.get("sqlalchemy.url"))
-    configuration["sqlalchemy.url"] = url
+    configuration["sqlalchemy.url"] = async_url(url)
     connectable = async_engine_from_config(
         configuration,
         prefix="sqlalchemy.",
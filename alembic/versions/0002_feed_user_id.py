@@ -0,0 +1,22 @@
+"""Cache resolved Twitter user id on feed."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_feed_user_id"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("feed", sa.Column("user_id", sa.String(), nullable=True))
+    op.add_column("feed", sa.Column("user_id_resolved_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("feed") as batch:
+        batch.drop_column("user_id_resolved_at")
+        batch.drop_column("user_id")
@@ -0,0 +1,22 @@
+"""Resumable backfill checkpoint on feed."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_feed_backfill"
+down_revision = "0003_rss_cache"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("feed", sa.Column("backfill_token", sa.String(), nullable=True))
+    op.add_column("feed", sa.Column("backfilled_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("feed") as batch:
+        batch.drop_column("backfilled_at")
+        batch.drop_column("backfill_token")
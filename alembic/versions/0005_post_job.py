@@ -0,0 +1,33 @@
+"""Work queue decoupling ingestion from LLM summarisation."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_post_job"
+down_revision = "0004_feed_backfill"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "postjob",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("post.id"), nullable=False),
+        sa.Column("status", sa.String(), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("available_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.Column("lease_until", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+    )
+    op.create_index("ix_postjob_post_id", "postjob", ["post_id"], unique=True)
+    op.create_index("ix_postjob_status", "postjob", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_postjob_status", table_name="postjob")
+    op.drop_index("ix_postjob_post_id", table_name="postjob")
+    op.drop_table("postjob")
@@ -0,0 +1,25 @@
+"""SimHash fingerprint and duplicate link on post."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_post_fingerprint"
+down_revision = "0005_post_job"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("post") as batch:
+        batch.add_column(sa.Column("fingerprint", sa.BigInteger(), nullable=True))
+        batch.add_column(sa.Column("duplicate_of_id", sa.Integer(), nullable=True))
+        batch.create_foreign_key("fk_post_duplicate_of_id_post", "post", ["duplicate_of_id"], ["id"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("post") as batch:
+        batch.drop_constraint("fk_post_duplicate_of_id_post", type_="foreignkey")
+        batch.drop_column("duplicate_of_id")
+        batch.drop_column("fingerprint")
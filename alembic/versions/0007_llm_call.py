@@ -0,0 +1,34 @@
+"""Per-call LLM telemetry."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_llm_call"
+down_revision = "0006_post_fingerprint"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "llmcall",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.Column("pipeline", sa.String(), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("latency_ms", sa.Float(), nullable=False),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=True),
+        sa.Column("completion_tokens", sa.Integer(), nullable=True),
+        sa.Column("max_tokens", sa.Integer(), nullable=True),
+    )
+    op.create_index("ix_llmcall_created_at", "llmcall", ["created_at"])
+    op.create_index("ix_llmcall_pipeline", "llmcall", ["pipeline"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_llmcall_pipeline", table_name="llmcall")
+    op.drop_index("ix_llmcall_created_at", table_name="llmcall")
+    op.drop_table("llmcall")
@@ -0,0 +1,29 @@
+"""Index for the per-user due-deck query."""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0008_flashcard_due_index"
+down_revision = "0007_llm_call"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # trailing id makes the (next_review, id) keyset order an index walk;
+    # built concurrently on Postgres so large flashcard tables stay writable
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_flashcard_owner_id_next_review",
+            "flashcard",
+            ["owner_id", "next_review", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_flashcard_owner_id_next_review", table_name="flashcard", postgresql_concurrently=True
+        )
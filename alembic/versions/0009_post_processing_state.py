@@ -0,0 +1,54 @@
+"""Explicit processing state on post, replacing the flashcard anti-join."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_post_processing_state"
+down_revision = "0008_flashcard_due_index"
+branch_labels = None
+depends_on = None
+
+_PENDING = sa.text("processing_state = 'pending'")
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("post") as batch:
+        batch.add_column(sa.Column("processing_state", sa.String(), nullable=False, server_default="pending"))
+        batch.add_column(sa.Column("processed_at", sa.DateTime(), nullable=True))
+
+    # backfill from what the anti-join used to infer: posts with cards or a
+    # finished job are done, failed jobs stay failed, duplicates are never sent
+    op.execute(
+        "UPDATE post SET processing_state = 'duplicate', processed_at = CURRENT_TIMESTAMP "
+        "WHERE duplicate_of_id IS NOT NULL"
+    )
+    op.execute(
+        "UPDATE post SET processing_state = 'done', processed_at = CURRENT_TIMESTAMP "
+        "WHERE processing_state = 'pending' AND ("
+        "id IN (SELECT post_id FROM flashcard) "
+        "OR id IN (SELECT post_id FROM postjob WHERE status = 'done'))"
+    )
+    op.execute(
+        "UPDATE post SET processing_state = 'failed', processed_at = CURRENT_TIMESTAMP "
+        "WHERE processing_state = 'pending' AND id IN (SELECT post_id FROM postjob WHERE status = 'failed')"
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_post_unprocessed",
+            "post",
+            ["id"],
+            postgresql_where=_PENDING,
+            sqlite_where=_PENDING,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_post_unprocessed", table_name="post", postgresql_concurrently=True)
+    with op.batch_alter_table("post") as batch:
+        batch.drop_column("processed_at")
+        batch.drop_column("processing_state")
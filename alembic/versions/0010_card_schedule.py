@@ -0,0 +1,69 @@
+"""Shared flashcard content with per-user SM-2 schedules."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010_card_schedule"
+down_revision = "0009_post_processing_state"
+branch_labels = None
+depends_on = None
+
+_SCHEDULE_COLUMNS = ("ease_factor", "interval", "repetitions", "next_review")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "cardschedule",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("flashcard_id", sa.Integer(), sa.ForeignKey("flashcard.id"), nullable=False),
+        sa.Column("ease_factor", sa.Float(), nullable=False, server_default="2.5"),
+        sa.Column("interval", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("repetitions", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("next_review", sa.Date(), nullable=False, server_default=sa.text("CURRENT_DATE")),
+        sa.PrimaryKeyConstraint("user_id", "flashcard_id"),
+    )
+    # every existing card has exactly one owner, whose state moves over as is
+    op.execute(
+        "INSERT INTO cardschedule (user_id, flashcard_id, ease_factor, interval, repetitions, next_review) "
+        "SELECT owner_id, id, ease_factor, interval, repetitions, next_review FROM flashcard"
+    )
+    op.create_index(
+        "ix_cardschedule_user_id_next_review", "cardschedule", ["user_id", "next_review", "flashcard_id"]
+    )
+
+    op.drop_index("ix_flashcard_owner_id_next_review", table_name="flashcard")
+    with op.batch_alter_table("flashcard") as batch:
+        for column in _SCHEDULE_COLUMNS:
+            batch.drop_column(column)
+        batch.drop_column("owner_id")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("flashcard") as batch:
+        batch.add_column(sa.Column("owner_id", sa.Integer(), nullable=True))
+        batch.add_column(sa.Column("ease_factor", sa.Float(), nullable=False, server_default="2.5"))
+        batch.add_column(sa.Column("interval", sa.Integer(), nullable=False, server_default="1"))
+        batch.add_column(sa.Column("repetitions", sa.Integer(), nullable=False, server_default="0"))
+        batch.add_column(
+            sa.Column("next_review", sa.Date(), nullable=False, server_default=sa.text("CURRENT_DATE"))
+        )
+
+    # a card studied by several users keeps the schedule of the first one
+    first = "(SELECT MIN(s.user_id) FROM cardschedule s WHERE s.flashcard_id = flashcard.id)"
+    op.execute(f"UPDATE flashcard SET owner_id = COALESCE({first}, (SELECT MIN(id) FROM \"user\"))")
+    for column in _SCHEDULE_COLUMNS:
+        op.execute(
+            f"UPDATE flashcard SET {column} = (SELECT s.{column} FROM cardschedule s "
+            f"WHERE s.flashcard_id = flashcard.id AND s.user_id = flashcard.owner_id) "
+            f"WHERE owner_id IN (SELECT user_id FROM cardschedule s WHERE s.flashcard_id = flashcard.id)"
+        )
+
+    with op.batch_alter_table("flashcard") as batch:
+        batch.alter_column("owner_id", existing_type=sa.Integer(), nullable=False)
+        batch.create_foreign_key("fk_flashcard_owner_id_user", "user", ["owner_id"], ["id"])
+    op.create_index("ix_flashcard_owner_id_next_review", "flashcard", ["owner_id", "next_review", "id"])
+
+    op.drop_index("ix_cardschedule_user_id_next_review", table_name="cardschedule")
+    op.drop_table("cardschedule")
@@ -0,0 +1,31 @@
+"""Append-only review log."""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011_review_log"
+down_revision = "0010_card_schedule"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # no secondary indexes: it is written on every review and read offline
+    op.create_table(
+        "reviewlog",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+        sa.Column("flashcard_id", sa.Integer(), sa.ForeignKey("flashcard.id"), nullable=False),
+        sa.Column("quality", sa.Integer(), nullable=False),
+        sa.Column("reviewed_at", sa.DateTime(), nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.Column("ease_factor", sa.Float(), nullable=False),
+        sa.Column("interval", sa.Integer(), nullable=False),
+        sa.Column("repetitions", sa.Integer(), nullable=False),
+        sa.Column("next_review", sa.Date(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("reviewlog")
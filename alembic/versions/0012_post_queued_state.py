@@ -0,0 +1,22 @@
+"""Queued processing state for posts owned by the job queue."""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "0012_post_queued_state"
+down_revision = "0011_review_log"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # posts with live jobs belong to the consumers, not posts_to_flashcards
+    op.execute(
+        "UPDATE post SET processing_state = 'queued' WHERE processing_state = 'pending' "
+        "AND id IN (SELECT post_id FROM postjob WHERE status IN ('pending', 'leased'))"
+    )
+
+
+def downgrade() -> None:
+    op.execute("UPDATE post SET processing_state = 'pending' WHERE processing_state = 'queued'")
@@ -1,13 +1,43 @@
 import type { NextApiRequest, NextApiResponse } from 'next';
 import axios from 'axios';
 
+const WORKER_URL = 'http://localhost:8000';
+
+// Let streamed NDJSON bodies through without Next's response size warning.
+export const config = { api: { responseLimit: false } };
+
+async function relayStream(req: NextApiRequest, res: NextApiResponse) {
+  const upstream = await fetch(`${WORKER_URL}/flashcards/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(req.body),
+  });
+  if (!upstream.ok || !upstream.body) {
+    return res.status(upstream.status === 502 ? 502 : 500).json({ error: await upstream.text() });
+  }
+  res.writeHead(200, {
+    'Content-Type': 'application/x-ndjson',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+  });
+  const reader = upstream.body.getReader();
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    res.write(value);
+  }
+  res.end();
+}
+
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
   if (req.method !== 'POST') return res.status(405).end();
 
   try {
-    const { data } = await axios.post('http://localhost:8000/flashcards', req.body);
+    if (req.query.stream) return await relayStream(req, res);
+    const { data } = await axios.post(`${WORKER_URL}/flashcards`, req.body);
     res.status(200).json(data);
   } catch (error: any) {
+    if (res.headersSent) return res.end();
     res.status(500).json({ error: error.message });
   }
 }
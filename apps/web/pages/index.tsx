@@ -12,8 +12,26 @@ export default function Home() {
   };
 
   const handleFlashcards = async () => {
-    const { data } = await axios.post('/api/flashcards', { text: input });
-    setCards(data.flashcards);
+    setCards([]);
+    const resp = await fetch('/api/flashcards?stream=1', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ text: input }),
+    });
+    if (!resp.ok || !resp.body) return;
+    // one JSON card per line, shown as soon as the worker has stored it
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffered += decoder.decode(value, { stream: true });
+      const lines = buffered.split('\n');
+      buffered = lines.pop() ?? '';
+      const parsed = lines.filter(Boolean).map((l) => JSON.parse(l)).filter((c) => !c.error);
+      if (parsed.length) setCards((prev) => [...prev, ...parsed]);
+    }
   };
 
   return (
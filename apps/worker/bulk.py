@@ -0,0 +1,185 @@
+"""Set-based persistence helpers shared by the ingestors and pipelines."""
+from __future__ import annotations
+
+import datetime as dt
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from packages.core.models import CardSchedule, Feed, Flashcard, Post, User
+from packages.core.simhash import simhash, to_signed
+
+# owner of generated cards until there is real auth, and the feed hand-submitted text goes to
+DEMO_USER_ID = 1
+MANUAL_FEED_ID = 1
+
+# Post.processing_state; only pending posts are picked up by posts_to_flashcards
+POST_PENDING = "pending"
+POST_QUEUED = "queued"  # has a PostJob, the queue consumers own it
+POST_DONE = "done"  # cards stored, possibly none
+POST_FAILED = "failed"  # gave up after retries
+POST_DUPLICATE = "duplicate"  # reuses the cards of Post.duplicate_of_id
+
+
+def insert_ignore(session: Session, model: type, index_elements: list[str]):
+    """Return an ``INSERT .. ON CONFLICT DO NOTHING`` for the session's dialect."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model)
+    else:  # pragma: no cover - we only deploy on Postgres and test on SQLite
+        raise NotImplementedError(f"Unsupported dialect {dialect!r}")
+    return stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+
+def _created_at(tweet: dict) -> dt.datetime:
+    """Return the tweet's own timestamp (UTC, naive) or now when absent."""
+    raw = tweet.get("created_at")
+    if not raw:
+        return dt.datetime.utcnow()
+    stamp = dt.datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    return stamp.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+
+def _newest(tweet_ids: list[str]) -> str:
+    # ids are decimal strings, longer means larger
+    return max(tweet_ids, key=lambda i: (len(i), i))
+
+
+def insert_posts(session: Session, feed: Feed, tweets: list[dict]) -> list[Post]:
+    """Persist unseen ``tweets`` for ``feed`` in one statement.
+
+    Existing ids are filtered with a single ``IN`` query, the rest are bulk
+    inserted ignoring conflicts on ``ix_post_tweet_id`` (another worker may
+    have won the race) and ``feed.last_post_id`` is advanced once. Returns
+    the posts that were actually inserted; the caller commits.
+    """
+    by_id = {str(t["id"]): t for t in tweets}
+    if not by_id:
+        return []
+    known = set(session.exec(select(Post.tweet_id).where(Post.tweet_id.in_(by_id))).all())
+    rows = [
+        {
+            "feed_id": feed.id,
+            "tweet_id": tweet_id,
+            "text": tweet["text"],
+            "created_at": _created_at(tweet),
+            "fingerprint": to_signed(simhash(tweet["text"])),
+        }
+        for tweet_id, tweet in by_id.items()
+        if tweet_id not in known
+    ]
+    new_posts: list[Post] = []
+    if rows:
+        stmt = (
+            insert_ignore(session, Post, ["tweet_id"])
+            .values(rows)
+            .returning(Post.id, Post.feed_id, Post.tweet_id, Post.text, Post.created_at, Post.fingerprint)
+        )
+        new_posts = [Post(**row._mapping) for row in session.execute(stmt)]
+
+    newest = _newest(list(by_id))
+    if feed.last_post_id is None or _newest([feed.last_post_id, newest]) == newest:
+        feed.last_post_id = newest
+        session.add(feed)
+    return new_posts
+
+
+def mark_posts(session: Session, post_ids: list[int], state: str) -> None:
+    """Set ``processing_state`` and ``processed_at`` of ``post_ids``; the caller commits."""
+    if post_ids:
+        session.execute(
+            update(Post)
+            .where(Post.id.in_(post_ids))
+            .values(processing_state=state, processed_at=dt.datetime.utcnow())
+        )
+
+
+def ensure_demo_rows(session: Session) -> None:
+    """Create the demo user and the manual feed if missing; the caller commits."""
+    now = dt.datetime.utcnow()
+    session.execute(
+        insert_ignore(session, User, ["id"]).values(id=DEMO_USER_ID, email="demo@example.com", created_at=now)
+    )
+    session.execute(insert_ignore(session, Feed, ["id"]).values(id=MANUAL_FEED_ID, handle="manual"))
+
+
+def flashcard_rows(post_id: int, cards: list) -> list[dict]:
+    """Column values for ``cards`` (anything with ``question``/``answer``, or dicts) of one post."""
+    rows = []
+    for card in cards:
+        if isinstance(card, dict):
+            question, answer = card["question"], card["answer"]
+        else:
+            question, answer = card.question, card.answer
+        row = Flashcard(post_id=post_id, question=question, answer=answer)
+        rows.append(row.model_dump(exclude={"id"}))
+    return rows
+
+
+def schedule_rows(card_ids: list[int], user_ids: tuple[int, ...] = (DEMO_USER_ID,)) -> list[dict]:
+    """Fresh SM-2 state putting ``card_ids`` in the deck of each of ``user_ids``."""
+    return [
+        CardSchedule(user_id=user_id, flashcard_id=card_id).model_dump()
+        for user_id in user_ids
+        for card_id in card_ids
+    ]
+
+
+def insert_flashcards_stmt(rows: list[dict]):
+    """One multi-values flashcard ``INSERT`` returning ``(id, question, answer)``."""
+    return insert(Flashcard).values(rows).returning(Flashcard.id, Flashcard.question, Flashcard.answer)
+
+
+def insert_schedules_stmt(rows: list[dict]):
+    """One multi-values ``INSERT`` of :func:`schedule_rows`."""
+    return insert(CardSchedule).values(rows)
+
+
+def insert_flashcards(session: Session, rows: list[dict], user_ids: tuple[int, ...] = (DEMO_USER_ID,)) -> list:
+    """Insert ``rows`` and schedule them for ``user_ids``; returns the new rows ordered by id.
+
+    The card text is written once however many users study it, each user
+    only adds a :class:`CardSchedule` row. Two statements in all; the caller
+    commits.
+    """
+    if not rows:
+        return []
+    stored = sorted(session.execute(insert_flashcards_stmt(rows)).all(), key=lambda r: r.id)
+    session.execute(insert_schedules_stmt(schedule_rows([r.id for r in stored], user_ids)))
+    return stored
+
+
+async def insert_flashcards_async(
+    session: AsyncSession, rows: list[dict], user_ids: tuple[int, ...] = (DEMO_USER_ID,)
+) -> list:
+    """:func:`insert_flashcards` for an ``AsyncSession``."""
+    if not rows:
+        return []
+    stored = sorted((await session.execute(insert_flashcards_stmt(rows))).all(), key=lambda r: r.id)
+    await session.execute(insert_schedules_stmt(schedule_rows([r.id for r in stored], user_ids)))
+    return stored
+
+
+__all__: list[str] = [
+    "DEMO_USER_ID",
+    "MANUAL_FEED_ID",
+    "POST_DONE",
+    "POST_DUPLICATE",
+    "POST_FAILED",
+    "POST_PENDING",
+    "POST_QUEUED",
+    "ensure_demo_rows",
+    "flashcard_rows",
+    "insert_flashcards",
+    "insert_flashcards_async",
+    "insert_flashcards_stmt",
+    "insert_ignore",
+    "insert_posts",
+    "insert_schedules_stmt",
+    "mark_posts",
+    "schedule_rows",
+]
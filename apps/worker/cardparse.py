@@ -0,0 +1,191 @@
+"""Tolerant extraction of flashcards from LLM JSON replies.
+
+Replies come back as bare arrays, wrapped objects (``{"flashcards": [...]}``,
+which ``response_format=json_object`` forces), inside Markdown fences or cut
+off at ``max_tokens``. :func:`parse_cards` copes with all of these and keeps
+every card that validates; :class:`CardStreamParser` does the same for a
+streamed reply, card by card.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from loguru import logger
+from pydantic import ValidationError
+
+from .schemas import Flashcard
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.I)
+# keys a wrapped reply is likely to use, tried before any other list value
+_WRAPPER_KEYS = ("flashcards", "cards", "items", "data")
+_MAX_REPAIR_CUTS = 64
+
+
+@dataclass
+class ParseStats:
+    """Running totals since process start."""
+
+    replies: int = 0
+    failures: int = 0  # replies with nothing decodable, i.e. paid for in vain
+    repaired: int = 0  # replies only decodable after repair
+    dropped: int = 0  # individual cards that failed validation
+
+
+stats = ParseStats()
+
+
+class CardParseError(ValueError):
+    """Raised when a reply holds no decodable JSON at all."""
+
+
+class CardStreamParser:
+    """Emit card objects as soon as their closing brace arrives.
+
+    Feed it the completion text chunk by chunk. Every JSON object whose
+    parent is an array is decoded when it closes, so both a bare
+    ``[{...}, ...]`` and a wrapped ``{"flashcards": [{...}]}`` reply work.
+    """
+
+    def __init__(self) -> None:
+        self._stack: list[str] = []  # open containers, "{" or "["
+        self._in_string = False
+        self._escaped = False
+        self._buf: list[str] = []
+        self._capture_depth: int | None = None  # stack depth of the object being captured
+
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        """Consume ``chunk`` and return the objects it completed."""
+        out: list[dict[str, Any]] = []
+        for ch in chunk:
+            if self._capture_depth is not None:
+                self._buf.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "{" and self._capture_depth is None and self._stack[-1:] == ["["]:
+                    self._capture_depth = len(self._stack)
+                    self._buf = [ch]
+                self._stack.append(ch)
+            elif ch in "}]" and self._stack:
+                self._stack.pop()
+                if ch == "}" and self._capture_depth == len(self._stack):
+                    self._capture_depth = None
+                    try:
+                        obj = json.loads("".join(self._buf))
+                    except ValueError:
+                        continue
+                    if isinstance(obj, dict):
+                        out.append(obj)
+        return out
+
+
+def repair_json(text: str) -> Any:
+    """Decode ``text``, closing whatever a truncated reply left open.
+
+    The reply is cut back to the last point where an object or array ended
+    and the still-open containers are closed, trying later cuts first.
+    """
+    stack: list[str] = []
+    in_string = escaped = False
+    cuts: list[tuple[int, str]] = []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]" and stack:
+            stack.pop()
+            cuts.append((i + 1, "".join("}" if c == "{" else "]" for c in reversed(stack))))
+    for end, closers in reversed(cuts[-_MAX_REPAIR_CUTS:]):
+        try:
+            return json.loads(text[:end] + closers)
+        except ValueError:
+            continue
+    raise CardParseError("no decodable JSON in reply")
+
+
+def decode_reply(text: str) -> Any:
+    """Decode a JSON reply, stripping Markdown fences and repairing truncation."""
+    stats.replies += 1
+    body = _FENCE.sub("", text or "")
+    try:
+        return json.loads(body)
+    except ValueError:
+        pass
+    start = min((i for i in (body.find("["), body.find("{")) if i >= 0), default=-1)
+    try:
+        if start < 0:
+            raise CardParseError("no JSON in reply")
+        decoded = repair_json(body[start:])
+    except CardParseError:
+        stats.failures += 1
+        logger.warning(f"Unparseable LLM reply: {text[:200]!r}")
+        raise
+    stats.repaired += 1
+    return decoded
+
+
+def card_list(decoded: Any) -> list[Any] | None:
+    """Return the list of raw cards in a decoded reply, unwrapping objects."""
+    if isinstance(decoded, list):
+        return decoded
+    if not isinstance(decoded, dict):
+        return None
+    if "question" in decoded:
+        return [decoded]
+    for key in _WRAPPER_KEYS:
+        if isinstance(decoded.get(key), list):
+            return decoded[key]
+    return next((v for v in decoded.values() if isinstance(v, list)), None)
+
+
+def validate_cards(raw_cards: list[Any]) -> list[dict[str, str]]:
+    """Return the cards that match the ``Flashcard`` schema, dropping the rest."""
+    out: list[dict[str, str]] = []
+    for raw in raw_cards:
+        try:
+            out.append(Flashcard.model_validate(raw).model_dump())
+        except ValidationError:
+            stats.dropped += 1
+    return out
+
+
+def parse_cards(text: str) -> list[dict[str, str]]:
+    """Return every valid card in an LLM reply.
+
+    Raises :class:`CardParseError` only when nothing in ``text`` decodes; a
+    reply that decodes but holds no cards yields an empty list.
+    """
+    raw_cards = card_list(decode_reply(text))
+    return validate_cards(raw_cards) if raw_cards else []
+
+
+__all__: list[str] = [
+    "CardParseError",
+    "CardStreamParser",
+    "ParseStats",
+    "card_list",
+    "decode_reply",
+    "parse_cards",
+    "repair_json",
+    "stats",
+    "validate_cards",
+]
@@ -44,14 +44,16 @@ def main(argv: list[str] | None = None) -> None:
 if __name__ == "__main__":
     main()
 
-"""Simple AnyIO cron to run ingestor daily."""
+"""Simple AnyIO cron to run the ingestor on adaptive per-feed intervals."""
 from __future__ import annotations
 
 import anyio
 from loguru import logger
 
 from packages.core.models import Feed
-from apps.worker.ingestors.twitter import ingest_handles
+from apps.worker.ingestors.twitter import ingest_handles_async
+from apps.worker.pipelines.jobs import run_consumers
+from apps.worker.polling import AdaptivePoller
 from apps.worker import init_db
 
 HANDLES = [
@@ -65,17 +67,16 @@ HANDLES = [
 ]
 
 
-async def job() -> None:  # noqa: D401
-    logger.info("Running ingest job…")
-    ingest_handles(HANDLES)
+async def job(handles: list[str] = HANDLES) -> None:  # noqa: D401
+    logger.info(f"Running ingest job for {handles}…")
+    await ingest_handles_async(handles)
 
 
 async def main() -> None:  # noqa: D401
     init_db()
-    while True:
-        await job()
-        # sleep 24h
-        await anyio.sleep(60 * 60 * 24)
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(run_consumers)
+        await AdaptivePoller(HANDLES, job).run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+"""Near-duplicate detection for ingested posts.
+
+Posts whose SimHash lies within ``DEDUP_MAX_DISTANCE`` bits of a post from
+the last ``DEDUP_WINDOW_DAYS`` are linked to it through
+``Post.duplicate_of_id`` and never queued for the LLM, so announcements
+echoed by several accounts are summarised once.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from packages.core.models import Post
+from packages.core.simhash import SimHashIndex
+from apps.worker.bulk import POST_DUPLICATE
+
+DEDUP_MAX_DISTANCE = int(os.environ.get("DEDUP_MAX_DISTANCE", "4"))
+DEDUP_WINDOW = dt.timedelta(days=int(os.environ.get("DEDUP_WINDOW_DAYS", "7")))
+# rebuild from the DB now and then to pick up posts other workers ingested
+DEDUP_INDEX_REFRESH_SECONDS = float(os.environ.get("DEDUP_INDEX_REFRESH_SECONDS", "600"))
+
+# LLM calls a post would have cost: summarise + flashcards
+CALLS_PER_POST = 2
+
+
+@dataclass
+class DedupStats:
+    """Running totals since process start."""
+
+    checked: int = 0
+    duplicates: int = 0
+
+    @property
+    def skipped_calls(self) -> int:
+        return self.duplicates * CALLS_PER_POST
+
+
+stats = DedupStats()
+
+_index: SimHashIndex[int] | None = None
+_built_at = 0.0
+
+
+def _load_index(session: Session, exclude: list[int]) -> SimHashIndex[int]:
+    global _index, _built_at
+    if _index is None or time.monotonic() - _built_at > DEDUP_INDEX_REFRESH_SECONDS:
+        index: SimHashIndex[int] = SimHashIndex(DEDUP_MAX_DISTANCE)
+        index.update(
+            session.exec(
+                select(Post.fingerprint, Post.id).where(
+                    Post.created_at >= dt.datetime.utcnow() - DEDUP_WINDOW,
+                    Post.fingerprint.is_not(None),
+                    Post.duplicate_of_id.is_(None),
+                    Post.id.not_in(exclude),
+                )
+            ).all()
+        )
+        _index, _built_at = index, time.monotonic()
+    return _index
+
+
+def reset_index() -> None:
+    """Drop the in-process index so the next call rebuilds it."""
+    global _index
+    _index = None
+
+
+def link_duplicates(session: Session, posts: list[Post]) -> dict[int, int]:
+    """Link near-duplicate ``posts`` to earlier ones and return ``{dup: original}``.
+
+    ``posts`` must already be flushed with ids and fingerprints; their
+    ``duplicate_of_id`` and ``processing_state`` are set too. The caller
+    commits, should only queue LLM work for posts not in the result, and
+    passes ``posts`` to :func:`remember` once the commit succeeded.
+    """
+    if not posts:
+        return {}
+    index = _load_index(session, [p.id for p in posts])
+    # originals in this batch stay out of the shared index until committed
+    batch: SimHashIndex[int] = SimHashIndex(DEDUP_MAX_DISTANCE)
+    links: dict[int, int] = {}
+    for post in posts:
+        if post.fingerprint is None:
+            continue
+        original = index.query(post.fingerprint)
+        if original is None:
+            original = batch.query(post.fingerprint)
+        if original is not None and original != post.id:
+            links[post.id] = post.duplicate_of_id = original
+            post.processing_state = POST_DUPLICATE
+        else:
+            batch.add(post.fingerprint, post.id)
+    if links:
+        now = dt.datetime.utcnow()
+        session.execute(
+            update(Post),
+            [
+                {"id": pid, "duplicate_of_id": orig, "processing_state": POST_DUPLICATE, "processed_at": now}
+                for pid, orig in links.items()
+            ],
+        )
+    stats.checked += len(posts)
+    stats.duplicates += len(links)
+    return links
+
+
+def remember(posts: list[Post]) -> None:
+    """Index the committed originals among ``posts`` for later batches."""
+    if _index is None:
+        return  # the next load reads them from the DB
+    _index.update((p.fingerprint, p.id) for p in posts if p.fingerprint is not None and p.duplicate_of_id is None)
+
+
+__all__: list[str] = ["DedupStats", "link_duplicates", "remember", "reset_index", "stats"]
@@ -0,0 +1,194 @@
+"""OpenAI-compatible stand-in server for load tests.
+
+Serves ``POST /v1/chat/completions`` with canned replies shaped like the
+worker's prompts (summaries, flashcard arrays, packed per-post objects), after
+a log-normally distributed delay and with configurable 5xx / 429 rates.
+Streaming requests get server-sent event chunks like the real API.
+
+Run it and point the worker at it::
+
+    python -m apps.worker.fake_openai --port 8001 --latency-ms 800 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn apps.worker.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+import anyio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_PACKED_ID = re.compile(r"^\[(\d+)\] ", re.M)
+
+
+@dataclass
+class FakeSettings:
+    """Behaviour of the fake server."""
+
+    latency_ms: float = 500.0  # median time to the full reply
+    latency_sigma: float = 0.5  # log-normal spread; 0 for a fixed delay
+    error_rate: float = 0.0  # share of requests answered with a 500
+    rate_limit_rate: float = 0.0  # share of requests answered with a 429
+    retry_after: float = 1.0  # seconds advertised on 429s
+    stream_chunks: int = 8  # chunks per streamed reply
+    seed: int | None = None
+    rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.rng = random.Random(self.seed)
+
+    def latency(self) -> float:
+        """Draw one reply delay in seconds."""
+        median = self.latency_ms / 1000
+        if self.latency_sigma <= 0:
+            return median
+        return self.rng.lognormvariate(math.log(median), self.latency_sigma)
+
+
+def reply_for(prompt: str) -> str:
+    """Return a plausible completion for one of the worker's prompts."""
+    if "mapping every post id" in prompt:
+        ids = _PACKED_ID.findall(prompt)
+        return json.dumps(
+            {pid: [{"question": f"What does post {pid} say?", "answer": "Something."}] for pid in ids}
+        )
+    if "flashcards" in prompt:
+        return json.dumps(
+            {
+                "flashcards": [
+                    {"question": "What is the main point?", "answer": "The text's first claim."},
+                    {"question": "Why does it matter?", "answer": "Because of its consequences."},
+                ]
+            }
+        )
+    words = prompt.split()
+    return " ".join(words[-20:])
+
+
+def _usage(prompt: str, content: str) -> dict[str, int]:
+    prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(content) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _error(status: int, message: str, kind: str, headers: dict[str, str] | None = None) -> JSONResponse:
+    body = {"error": {"message": message, "type": kind, "param": None, "code": None}}
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def create_app(settings: FakeSettings | None = None) -> FastAPI:
+    """Build the fake server around ``settings``."""
+    settings = settings or FakeSettings()
+    app = FastAPI(title="Fake OpenAI")
+    app.state.settings = settings
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        app.state.requests += 1
+        roll = settings.rng.random()
+        if roll < settings.rate_limit_rate:
+            return _error(
+                429, "Rate limit reached", "requests", {"retry-after": str(settings.retry_after)}
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            await anyio.sleep(settings.latency() / 2)
+            return _error(500, "The server had an error", "server_error")
+
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        content = reply_for(prompt)
+        model = body.get("model", "gpt-3.5-turbo")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        delay = settings.latency()
+
+        if not body.get("stream"):
+            await anyio.sleep(delay)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(prompt, content),
+            }
+
+        async def events():
+            size = max(1, math.ceil(len(content) / max(1, settings.stream_chunks)))
+            pieces = [content[i : i + size] for i in range(0, len(content), size)]
+            for i, piece in enumerate(pieces):
+                await anyio.sleep(delay / len(pieces))
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"role": "assistant", "content": piece} if i == 0 else {"content": piece},
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+__all__: list[str] = ["FakeSettings", "create_app", "reply_for"]
+
+
+def main(argv: list[str] | None = None) -> None:  # pragma: no cover - manual run
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    settings = FakeSettings(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":  # pragma: no cover - manual run
+    main()
@@ -2,18 +2,96 @@
 
 from __future__ import annotations
 
+import datetime as dt
+import hashlib
+import os
 import xml.etree.ElementTree as ET
-from typing import List, Dict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List
 
 import httpx
+from sqlmodel import Session
 
+from packages.core.models import RssCache
+from apps.worker import engine
 
-async def fetch_rss(url: str) -> str:
-    """Fetch raw RSS feed text from the given URL."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        return response.text
+# posts handed to an ingest ``store`` callback at a time
+RSS_STORE_CHUNK = int(os.environ.get("RSS_STORE_CHUNK", "100"))
+
+# in-process copy of the persisted validators, keyed by URL
+_validators: dict[str, RssCache] = {}
+# validators of bodies handed out but not yet stored by the caller
+_pending: dict[str, RssCache] = {}
+
+
+def _load_validators(url: str) -> RssCache | None:
+    if url not in _validators:
+        with Session(engine) as ses:
+            row = ses.get(RssCache, url)
+            if row is None:
+                return None
+            _validators[url] = RssCache(**row.model_dump())
+    return _validators[url]
+
+
+def _save_validators(state: RssCache) -> None:
+    _validators[state.url] = state
+    with Session(engine) as ses:
+        ses.merge(RssCache(**state.model_dump()))
+        ses.commit()
+
+
+def commit_validators(url: str) -> None:
+    """Persist the validators of the last body fetched from ``url``.
+
+    Call once its items are stored: until then a failed parse or write must
+    not turn the next poll into a 304 and lose those items.
+    """
+    state = _pending.pop(url, None)
+    if state is not None:
+        _save_validators(state)
+
+
+def _conditional_headers(state: RssCache | None) -> dict[str, str]:
+    headers: dict[str, str] = {}
+    if state and state.etag:
+        headers["If-None-Match"] = state.etag
+    if state and state.last_modified:
+        headers["If-Modified-Since"] = state.last_modified
+    return headers
+
+
+async def fetch_rss(url: str, client: httpx.AsyncClient | None = None) -> str | None:
+    """Fetch raw RSS feed text from the given URL.
+
+    Sends the ``ETag``/``Last-Modified`` validators of the previous fetch and
+    returns ``None`` when the server answers 304 or the body hashes to the
+    same content as last time. The new validators are kept back until
+    :func:`commit_validators` is called.
+    """
+    if client is None:
+        async with httpx.AsyncClient() as own:
+            return await fetch_rss(url, own)
+
+    state = _load_validators(url)
+    response = await client.get(url, headers=_conditional_headers(state))
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+
+    fresh = RssCache(
+        url=url,
+        etag=response.headers.get("etag"),
+        last_modified=response.headers.get("last-modified"),
+        content_hash=hashlib.sha256(response.content).hexdigest(),
+        checked_at=dt.datetime.utcnow(),
+    )
+    unchanged = state is not None and state.content_hash == fresh.content_hash
+    if unchanged:
+        if (state.etag, state.last_modified) != (fresh.etag, fresh.last_modified):
+            _save_validators(fresh)  # nothing new to store
+        return None
+    _pending[url] = fresh
+    return response.text
 
 
 def parse_rss(xml_text: str) -> List[Dict[str, str]]:
@@ -28,16 +106,138 @@ def parse_rss(xml_text: str) -> List[Dict[str, str]]:
     return posts
 
 
-async def ingest_twitter(handle: str) -> List[Dict[str, str]]:
-    """Return recent tweets for the handle via nitter RSS."""
-    url = f"https://nitter.net/{handle}/rss"
-    xml = await fetch_rss(url)
-    return parse_rss(xml)
+class _ItemReader:
+    """Incremental RSS item extractor that discards items once read."""
+
+    def __init__(self, last_seen: str | None = None) -> None:
+        self.last_seen = last_seen
+        self.done = False
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._stack: list[ET.Element] = []
+
+    def feed(self, chunk: bytes) -> List[Dict[str, str]]:
+        """Parse ``chunk`` and return the items it completed."""
+        posts: List[Dict[str, str]] = []
+        if self.done:
+            return posts
+        self._parser.feed(chunk)
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._stack.append(elem)
+                continue
+            self._stack.pop()
+            if elem.tag != "item":
+                continue
+            title = elem.findtext("title")
+            link = elem.findtext("link")
+            guid = elem.findtext("guid")
+            # drop the finished item so memory stays flat on large feeds
+            if self._stack:
+                self._stack[-1].remove(elem)
+            if self.last_seen is not None and self.last_seen in (link, guid):
+                self.done = True
+                break
+            if title and link:
+                posts.append({"title": title, "link": link})
+        return posts
+
+
+def iter_rss_items(chunks: Iterable[bytes], last_seen: str | None = None) -> Iterator[Dict[str, str]]:
+    """Yield posts from RSS byte chunks, stopping at ``last_seen`` link or guid."""
+    reader = _ItemReader(last_seen)
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+        if reader.done:
+            return
+
+
+async def stream_rss(
+    url: str,
+    last_seen: str | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> AsyncIterator[Dict[str, str]]:
+    """Stream posts newer than ``last_seen`` from the feed at ``url``.
+
+    The body is parsed while it downloads and the connection is closed as
+    soon as the last seen item is reached; without ``last_seen`` the whole
+    feed is read. Conditional GET validators are honoured like in
+    :func:`fetch_rss` and, once the body is read, kept for
+    :func:`commit_validators` together with the hash of a fully read body.
+    """
+    if client is None:
+        async with httpx.AsyncClient() as own:
+            async for post in stream_rss(url, last_seen, own):
+                yield post
+        return
+
+    state = _load_validators(url)
+    async with client.stream("GET", url, headers=_conditional_headers(state)) as response:
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+        reader = _ItemReader(last_seen)
+        digest = hashlib.sha256()
+        async for chunk in response.aiter_bytes():
+            digest.update(chunk)
+            for post in reader.feed(chunk):
+                yield post
+            if reader.done:
+                break
+        _pending[url] = RssCache(
+            url=url,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+            # only a fully read body can be compared by hash later on
+            content_hash=None if reader.done else digest.hexdigest(),
+            checked_at=dt.datetime.utcnow(),
+        )
+
+
+Store = Callable[[List[Dict[str, str]]], Awaitable[None]]
+
+
+async def _ingest(url: str, last_seen: str | None, store: Store | None) -> List[Dict[str, str]] | None:
+    _pending.pop(url, None)  # left by a poll whose store failed
+    previous = _load_validators(url)
+    posts: List[Dict[str, str]] = []
+    async for post in stream_rss(url, last_seen):
+        posts.append(post)
+        if store is not None and len(posts) >= RSS_STORE_CHUNK:
+            await store(posts)
+            posts = []
+    fresh = _pending.get(url)
+    if fresh and previous and fresh.content_hash and fresh.content_hash == previous.content_hash:
+        # the body last stored in full: its items are in already
+        posts = []
+    elif store is not None and posts:
+        await store(posts)
+    commit_validators(url)
+    return None if store is not None else posts
+
+
+async def ingest_twitter(
+    handle: str, last_seen: str | None = None, store: Store | None = None
+) -> List[Dict[str, str]] | None:
+    """Return recent tweets for the handle via nitter RSS.
+
+    Empty when the feed has not changed since the previous call. With
+    ``last_seen`` only items newer than that link or guid are returned.
+    Pass ``store`` to persist the items in chunks of ``RSS_STORE_CHUNK`` as
+    they stream in, before the feed is marked as seen; nothing is returned.
+    """
+    return await _ingest(f"https://nitter.net/{handle}/rss", last_seen, store)
 
 
-async def ingest_youtube(channel_id: str) -> List[Dict[str, str]]:
-    """Return recent YouTube uploads for the channel via RSS."""
-    url = f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
-    xml = await fetch_rss(url)
-    return parse_rss(xml)
+async def ingest_youtube(
+    channel_id: str, last_seen: str | None = None, store: Store | None = None
+) -> List[Dict[str, str]] | None:
+    """Return recent YouTube uploads for the channel via RSS.
 
+    Empty when the feed has not changed since the previous call. With
+    ``last_seen`` only items newer than that link or guid are returned.
+    Pass ``store`` to persist the items in chunks of ``RSS_STORE_CHUNK`` as
+    they stream in, before the feed is marked as seen; nothing is returned.
+    """
+    return await _ingest(
+        f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}", last_seen, store
+    )
@@ -0,0 +1,112 @@
+"""Token-bucket scheduler driven by Twitter's ``x-rate-limit-*`` headers."""
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Mapping
+
+import anyio
+
+
+@dataclass
+class Bucket:
+    """Rate-limit window state for one endpoint."""
+
+    limit: int | None = None
+    remaining: int | None = None
+    reset_at: float = 0.0  # epoch seconds when the window refills
+    next_slot: float = 0.0  # earliest time the next request may start
+    blocked_until: float = 0.0  # set after a 429
+
+
+class RateLimiter:
+    """Spread requests over each endpoint's rate-limit window.
+
+    While more than ``burst_fraction`` of a window's budget is left requests
+    go straight through; below that they are spaced evenly until the reset.
+    A 429 blocks the endpoint until the reset (or an exponential delay when
+    the headers are missing) plus jitter.
+    """
+
+    def __init__(
+        self,
+        burst_fraction: float = 0.5,
+        base_backoff: float = 2.0,
+        max_backoff: float = 15 * 60,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.burst_fraction = burst_fraction
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.buckets: dict[str, Bucket] = {}
+        self._lock = anyio.Lock()
+
+    def _bucket(self, key: str) -> Bucket:
+        return self.buckets.setdefault(key, Bucket())
+
+    def delay(self, key: str) -> float:
+        """Reserve a slot for ``key`` and return how long to wait for it."""
+        bucket = self._bucket(key)
+        now = self.clock()
+        if bucket.reset_at <= now:
+            # window rolled over, the next response tells us the new budget
+            bucket.remaining = None
+        start = max(now, bucket.next_slot, bucket.blocked_until)
+        spacing = 0.0
+        if bucket.remaining is not None:
+            if bucket.remaining <= 0:
+                start = max(start, bucket.reset_at)
+            elif bucket.limit and bucket.remaining <= bucket.limit * self.burst_fraction:
+                spacing = max(bucket.reset_at - start, 0.0) / bucket.remaining
+            bucket.remaining -= 1
+        bucket.next_slot = start + spacing
+        return start - now
+
+    async def acquire(self, key: str) -> None:
+        """Wait until a request to ``key`` fits the current budget."""
+        async with self._lock:
+            wait = self.delay(key)
+        if wait > 0:
+            await anyio.sleep(wait)
+
+    def update(self, key: str, headers: Mapping[str, str]) -> None:
+        """Record the budget reported by a response."""
+        bucket = self._bucket(key)
+        try:
+            if "x-rate-limit-limit" in headers:
+                bucket.limit = int(headers["x-rate-limit-limit"])
+            if "x-rate-limit-remaining" in headers:
+                bucket.remaining = int(headers["x-rate-limit-remaining"])
+            if "x-rate-limit-reset" in headers:
+                bucket.reset_at = float(headers["x-rate-limit-reset"])
+        except ValueError:
+            return
+
+    def backoff(self, key: str, headers: Mapping[str, str], attempt: int) -> float:
+        """Block ``key`` after a 429 and return the jittered wait in seconds."""
+        self.update(key, headers)
+        bucket = self._bucket(key)
+        now = self.clock()
+        wait = bucket.reset_at - now if bucket.reset_at > now else self.base_backoff * 2**attempt
+        wait = min(wait, self.max_backoff) + random.uniform(0, self.base_backoff)
+        bucket.remaining = 0
+        bucket.blocked_until = max(bucket.blocked_until, now + wait)
+        return wait
+
+    def budget(self) -> dict[str, dict[str, float | int | None]]:
+        """Return the known budget per endpoint."""
+        now = self.clock()
+        return {
+            key: {
+                "limit": b.limit,
+                "remaining": b.remaining,
+                "reset_in": max(b.reset_at - now, 0.0),
+                "blocked_for": max(b.blocked_until - now, 0.0),
+            }
+            for key, b in self.buckets.items()
+        }
+
+
+__all__: list[str] = ["Bucket", "RateLimiter"]
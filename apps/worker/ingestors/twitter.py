@@ -1,15 +1,24 @@
 """Twitter/X ingestion using the v2 API."""
 from __future__ import annotations
 
+import datetime as dt
 import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator
 
 import anyio
 import httpx
+from loguru import logger
 from sqlmodel import Session, select
 
-from packages.core.models import Feed, Flashcard, Post
-from apps.worker import engine
-from apps.worker.main import generate_flashcards, summarise, TextIn
+from packages.core.models import Feed, Post
+from apps.worker import engine, init_demo_rows
+from apps.worker import dedup
+from apps.worker.bulk import insert_posts
+from apps.worker.ingestors.ratelimit import RateLimiter
+from apps.worker.pipelines.jobs import enqueue_posts, run_consumers
+from apps.worker.polling import AdaptivePoller
 
 BEARER_TOKEN = os.environ.get("TWITTER_BEARER_TOKEN", "")
 
@@ -17,38 +26,160 @@ HEADERS = {"Authorization": f"Bearer {BEARER_TOKEN}"}
 USER_URL = "https://api.twitter.com/2/users/by/username/{username}"
 TWEETS_URL = "https://api.twitter.com/2/users/{user_id}/tweets"
 
+# max number of handles processed at the same time
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "4"))
+# how long a resolved user id is trusted before it is looked up again
+USER_ID_TTL = dt.timedelta(seconds=int(os.environ.get("TWITTER_USER_ID_TTL", str(7 * 24 * 3600))))
 
-async def get_user_id(handle: str) -> str:
-    """Return Twitter user id for handle."""
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            USER_URL.format(username=handle.lstrip("@")),
-            headers=HEADERS,
-            timeout=20,
-        )
-        resp.raise_for_status()
-        return resp.json()["data"]["id"]
+# largest page the user timeline endpoint serves, used for backfills
+BACKFILL_PAGE_SIZE = 100
 
+# attempts per request when the API answers 429
+RATE_LIMIT_RETRIES = int(os.environ.get("TWITTER_RATE_LIMIT_RETRIES", "3"))
 
-async def fetch_latest(handle: str, since_id: str | None = None) -> list[dict]:
+# shared by every handle so the whole process respects one budget per endpoint
+rate_limiter = RateLimiter()
+
+# in-process handle -> (user id, resolved at) cache, seeded from ``Feed.user_id``
+_user_ids: dict[str, tuple[str, dt.datetime]] = {}
+
+
+@dataclass
+class HandleStats:
+    """Outcome of a single handle within an ingestion pass."""
+
+    handle: str
+    new_posts: int = 0
+    duplicates: int = 0  # new posts linked to an earlier near-duplicate, not sent to the LLM
+    seconds: float = 0.0
+    error: str | None = None
+
+
+def make_client() -> httpx.AsyncClient:
+    """Return a keep-alive client shared by every request of a pass."""
+    return httpx.AsyncClient(
+        headers=HEADERS,
+        timeout=20,
+        limits=httpx.Limits(
+            max_connections=INGEST_CONCURRENCY * 2,
+            max_keepalive_connections=INGEST_CONCURRENCY * 2,
+        ),
+    )
+
+
+async def _get(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    url: str,
+    params: dict[str, str] | None = None,
+) -> httpx.Response:
+    """GET ``url`` through the rate limiter, backing off on 429."""
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await rate_limiter.acquire(endpoint)
+        resp = await client.get(url, params=params)
+        if resp.status_code != 429:
+            rate_limiter.update(endpoint, resp.headers)
+            return resp
+        if attempt == RATE_LIMIT_RETRIES:
+            break
+        wait = rate_limiter.backoff(endpoint, resp.headers, attempt)
+        logger.warning(f"Rate limited on {endpoint}, backing off {wait:.1f}s")
+        await anyio.sleep(wait)
+    return resp
+
+
+def remember_user_id(handle: str, user_id: str, resolved_at: dt.datetime | None = None) -> None:
+    """Seed the in-process user id cache, e.g. from a persisted ``Feed``."""
+    _user_ids[handle] = (user_id, resolved_at or dt.datetime.utcnow())
+
+
+def cached_user_id(handle: str) -> tuple[str, dt.datetime] | None:
+    """Return the cached ``(user_id, resolved_at)`` for handle if still fresh."""
+    entry = _user_ids.get(handle)
+    if entry and dt.datetime.utcnow() - entry[1] < USER_ID_TTL:
+        return entry
+    return None
+
+
+async def get_user_id(
+    handle: str,
+    client: httpx.AsyncClient | None = None,
+    refresh: bool = False,
+) -> str:
+    """Return Twitter user id for handle.
+
+    Served from the in-process cache unless ``refresh`` is set or the
+    entry is older than ``USER_ID_TTL``.
+    """
+    entry = None if refresh else cached_user_id(handle)
+    if entry:
+        return entry[0]
+    if client is None:
+        async with make_client() as own:
+            return await get_user_id(handle, own, refresh)
+    resp = await _get(client, "users", USER_URL.format(username=handle.lstrip("@")))
+    resp.raise_for_status()
+    user_id = resp.json()["data"]["id"]
+    remember_user_id(handle, user_id)
+    return user_id
+
+
+async def _fetch_page(handle: str, client: httpx.AsyncClient, params: dict[str, str]) -> dict:
+    """Return one raw timeline page (``data`` and ``meta``) for handle."""
+    user_id = await get_user_id(handle, client)
+    resp = await _get(client, "tweets", TWEETS_URL.format(user_id=user_id), params)
+    if resp.status_code == 404:
+        # stale id (account recreated or renamed): resolve once more and retry
+        user_id = await get_user_id(handle, client, refresh=True)
+        resp = await _get(client, "tweets", TWEETS_URL.format(user_id=user_id), params)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def fetch_latest(
+    handle: str,
+    since_id: str | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> list[dict]:
     """Return latest tweets for handle since ``since_id``."""
-    user_id = await get_user_id(handle)
+    if client is None:
+        async with make_client() as own:
+            return await fetch_latest(handle, since_id, own)
     params: dict[str, str] = {
         "max_results": "5",
         "exclude": "replies",
-        "tweet.fields": "id,text",
+        "tweet.fields": "id,text,created_at",
     }
     if since_id:
         params["since_id"] = since_id
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            TWEETS_URL.format(user_id=user_id),
-            params=params,
-            headers=HEADERS,
-            timeout=20,
-        )
-        resp.raise_for_status()
-        return resp.json().get("data", [])
+    page = await _fetch_page(handle, client, params)
+    return page.get("data", [])
+
+
+async def iter_timeline(
+    handle: str,
+    client: httpx.AsyncClient,
+    pagination_token: str | None = None,
+    page_size: int = BACKFILL_PAGE_SIZE,
+) -> AsyncIterator[tuple[list[dict], str | None]]:
+    """Yield ``(tweets, next_token)`` pages from newest to oldest.
+
+    Starts at ``pagination_token`` when resuming; ``next_token`` is ``None``
+    on the last page.
+    """
+    params: dict[str, str] = {
+        "max_results": str(page_size),
+        "exclude": "replies",
+        "tweet.fields": "id,text,created_at",
+    }
+    while True:
+        if pagination_token:
+            params["pagination_token"] = pagination_token
+        page = await _fetch_page(handle, client, params)
+        pagination_token = page.get("meta", {}).get("next_token")
+        yield page.get("data", []), pagination_token
+        if not pagination_token:
+            return
 
 
 def _ensure_feed(session: Session, handle: str) -> Feed:
@@ -61,45 +192,156 @@ def _ensure_feed(session: Session, handle: str) -> Feed:
     return feed
 
 
-def ingest_handles(handles: list[str]) -> None:
-    """Pull tweets, summarise, and persist new posts."""
+def _persist_user_id(feed_id: int, handle: str) -> None:
+    """Write a newly resolved user id back to the feed row."""
+    entry = _user_ids.get(handle)
+    if entry is None:
+        return
+    with Session(engine) as session:
+        feed = session.get(Feed, feed_id)
+        if (feed.user_id, feed.user_id_resolved_at) == entry:
+            return
+        feed.user_id, feed.user_id_resolved_at = entry
+        session.add(feed)
+        session.commit()
+
+
+def _enqueue_unique(session: Session, posts: list[Post]) -> None:
+    """Queue LLM work for ``posts`` that are not near-duplicates of earlier ones."""
+    links = dedup.link_duplicates(session, posts)
+    enqueue_posts(session, [p.id for p in posts if p.id not in links])
+
+
+def _store_tweets(feed_id: int, tweets: list[dict]) -> list[Post]:
+    """Persist and enqueue unseen ``tweets`` in one transaction, return the new posts."""
+    with Session(engine) as session:
+        feed = session.get(Feed, feed_id)
+        posts = insert_posts(session, feed, tweets)
+        _enqueue_unique(session, posts)
+        session.commit()
+        dedup.remember(posts)
+        return posts
 
+
+def _store_page(feed_id: int, tweets: list[dict], next_token: str | None) -> list[Post]:
+    """Persist a backfill page together with the checkpoint to resume after it."""
     with Session(engine) as session:
-        for handle in handles:
+        feed = session.get(Feed, feed_id)
+        posts = insert_posts(session, feed, tweets)
+        _enqueue_unique(session, posts)
+        feed.backfill_token = next_token
+        if next_token is None:
+            feed.backfilled_at = dt.datetime.utcnow()
+        session.add(feed)
+        session.commit()
+        dedup.remember(posts)
+        return posts
+
+
+async def ingest_handle(handle: str, client: httpx.AsyncClient, backfill: bool = False) -> HandleStats:
+    """Pull and persist new tweets for a single handle, queueing them for the LLM.
+
+    With ``backfill`` (or when a previous backfill was interrupted) the whole
+    timeline is paged through at the API maximum, checkpointing after every
+    page so a crash resumes where it stopped.
+    """
+    stats = HandleStats(handle=handle)
+    started = time.perf_counter()
+    try:
+        with Session(engine) as session:
             feed = _ensure_feed(session, handle)
-            tweets = anyio.run(fetch_latest, handle, feed.last_post_id)  # noqa: WPS420
-            for tweet in tweets:
-                if session.exec(select(Post).where(Post.tweet_id == str(tweet["id"]))).first():
-                    continue
-                post = Post(feed_id=feed.id, tweet_id=str(tweet["id"]), text=tweet["text"])
-                session.add(post)
-                session.commit()
-                session.refresh(post)
-
-                summary = anyio.run(summarise, TextIn(text=post.text))  # noqa: WPS420
-                cards = anyio.run(generate_flashcards, TextIn(text=summary.summary))  # noqa: WPS420
-                for c in cards.flashcards:
-                    card = Flashcard(post_id=post.id, owner_id=1, question=c.question, answer=c.answer)
-                    session.add(card)
-                feed.last_post_id = str(tweet["id"])
-            session.commit()
+            feed_id, since_id, token = feed.id, feed.last_post_id, feed.backfill_token
+            if feed.user_id and feed.user_id_resolved_at and handle not in _user_ids:
+                remember_user_id(handle, feed.user_id, feed.user_id_resolved_at)
+        if backfill or token:
+            async for tweets, next_token in iter_timeline(handle, client, token):
+                posts = _store_page(feed_id, tweets, next_token)
+                stats.new_posts += len(posts)
+                stats.duplicates += sum(p.duplicate_of_id is not None for p in posts)
+        else:
+            tweets = await fetch_latest(handle, since_id, client)
+            posts = _store_tweets(feed_id, tweets)
+            stats.new_posts = len(posts)
+            stats.duplicates = sum(p.duplicate_of_id is not None for p in posts)
+        _persist_user_id(feed_id, handle)
+    except (httpx.HTTPError, KeyError) as exc:
+        logger.warning(f"Ingest of {handle} failed: {exc!r}")
+        stats.error = repr(exc)
+    stats.seconds = time.perf_counter() - started
+    logger.info(
+        f"Ingested {handle}: {stats.new_posts} new posts ({stats.duplicates} duplicates) in {stats.seconds:.2f}s"
+    )
+    return stats
+
+
+async def ingest_handles_async(
+    handles: list[str],
+    concurrency: int = INGEST_CONCURRENCY,
+    client: httpx.AsyncClient | None = None,
+    backfill: bool = False,
+) -> list[HandleStats]:
+    """Ingest ``handles`` concurrently over a single pooled HTTP client.
+
+    At most ``concurrency`` handles are in flight at once. Returns one
+    :class:`HandleStats` per handle, in input order.
+    """
+    if client is None:
+        async with make_client() as own:
+            return await ingest_handles_async(handles, concurrency, own, backfill)
+
+    limiter = anyio.CapacityLimiter(max(1, concurrency))
+    results: dict[str, HandleStats] = {}
+
+    async def run(handle: str) -> None:
+        async with limiter:
+            results[handle] = await ingest_handle(handle, client, backfill)
+
+    started = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for handle in dict.fromkeys(handles):
+            tg.start_soon(run, handle)
+    logger.info(f"Ingest pass over {len(results)} handles took {time.perf_counter() - started:.2f}s")
+    logger.info(f"Twitter rate-limit budget: {rate_limiter.budget()}")
+    logger.info(
+        f"Near-duplicates so far: {dedup.stats.duplicates}/{dedup.stats.checked} posts, "
+        f"{dedup.stats.skipped_calls} LLM calls skipped"
+    )
+    return [results[h] for h in dict.fromkeys(handles)]
+
+
+def ingest_handles(handles: list[str]) -> list[HandleStats]:
+    """Pull tweets and persist new posts for the LLM consumers."""
+    return anyio.run(ingest_handles_async, handles)
 
 
 async def scheduler(handles: list[str]) -> None:
-    """Run ingestion periodically every 15 minutes."""
-    while True:
-        ingest_handles(handles)
-        await anyio.sleep(60 * 15)
+    """Run ingestion forever, polling each handle on its own adaptive interval."""
+    await AdaptivePoller(handles, ingest_handles_async).run()
+
 
+async def _run(handles: list[str], backfill: bool) -> None:
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(run_consumers)
+        if backfill:
+            await ingest_handles_async(handles, backfill=True)
+        await scheduler(handles)
 
-def main() -> None:
+
+def main(argv: list[str] | None = None) -> None:
     """CLI entrypoint for running the ingestor."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Twitter ingestor")
+    parser.add_argument("--backfill", action="store_true", help="Page through full timelines first")
+    args = parser.parse_args(argv)
+
     handles_env = os.environ.get(
         "FEED_HANDLES",
         "dr_cintas,GoogleLabs,kregenrek,GeminiApp,OpenAI,AnthropicAI,GoogleAI",
     )
     handles = [h.strip() for h in handles_env.split(",") if h.strip()]
-    anyio.run(scheduler, handles)
+    init_demo_rows()  # the consumers schedule new cards for the demo user
+    anyio.run(_run, handles, args.backfill)
 
 
 if __name__ == "__main__":  # pragma: no cover - manual run
@@ -0,0 +1,257 @@
+"""Shared helpers around the OpenAI chat-completion API.
+
+Every completion goes through :func:`complete`, which serves repeated
+requests from a content-addressed cache: the key is a hash of the model,
+messages and parameters, an in-memory LRU sits in front of an optional
+on-disk tier (``LLM_CACHE_DIR``) so results survive restarts and are shared
+between worker processes on the same host. Identical requests that arrive
+while one is already in flight wait for that call instead of starting
+their own (single-flight). Upstream calls go through
+:data:`apps.worker.resilience.guard`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import anyio
+from openai import AsyncOpenAI
+
+from apps.worker import resilience, telemetry
+
+# point at a compatible server (e.g. apps.worker.fake_openai) instead of api.openai.com
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_TIMEOUT_SECONDS", "60"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "2"))
+
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR") or None
+LLM_CACHE_DISK_ENTRIES = int(os.environ.get("LLM_CACHE_DISK_ENTRIES", "100000"))
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters of an :class:`LLMCache`."""
+
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    coalesced: int = 0  # misses that joined an identical in-flight call
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+
+class LLMCache:
+    """Two-tier LRU + disk cache of completion texts with TTL expiry."""
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_SIZE,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        directory: str | Path | None = LLM_CACHE_DIR,
+        max_disk_entries: int = LLM_CACHE_DISK_ENTRIES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.directory = Path(directory) if directory else None
+        self.max_disk_entries = max_disk_entries
+        self.stats = CacheStats()
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._disk_entries = 0
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._disk_entries = sum(1 for _ in self.directory.glob("*/*.json"))
+
+    @staticmethod
+    def key(model: str, messages: list[dict[str, Any]], **params: Any) -> str:
+        """Return the content address of a request."""
+        blob = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, expires_at: float, value: str) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, key: str) -> str | None:
+        """Return the cached completion for ``key`` if present and fresh."""
+        return self.lookup(key)[0]
+
+    def lookup(self, key: str) -> tuple[str | None, str | None]:
+        """Like :meth:`get`, also naming the tier that answered (``memory`` / ``disk``)."""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry and entry[0] > now:
+            self._memory.move_to_end(key)
+            self.stats.memory_hits += 1
+            return entry[1], "memory"
+        self._memory.pop(key, None)
+        if self.directory:
+            path = self._path(key)
+            try:
+                stored = json.loads(path.read_text())
+            except (OSError, ValueError):
+                stored = None
+            if stored and stored["expires_at"] > now:
+                self._remember(key, stored["expires_at"], stored["content"])
+                self.stats.disk_hits += 1
+                return stored["content"], "disk"
+            if stored:
+                path.unlink(missing_ok=True)
+                self._disk_entries -= 1
+        self.stats.misses += 1
+        return None, None
+
+    def set(self, key: str, value: str) -> None:
+        """Store ``value`` in both tiers."""
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, value)
+        if self.directory:
+            path = self._path(key)
+            path.parent.mkdir(exist_ok=True)
+            self._disk_entries += not path.exists()
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"expires_at": expires_at, "content": value}))
+            tmp.replace(path)
+            if self._disk_entries > self.max_disk_entries:
+                self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        """Delete the oldest files down to 90% of the disk budget."""
+        files = sorted(self.directory.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        excess = len(files) - int(self.max_disk_entries * 0.9)
+        for path in files[: max(excess, 0)]:
+            path.unlink(missing_ok=True)
+            self.stats.evictions += 1
+        self._disk_entries = len(files) - max(excess, 0)
+
+    def discard(self, key: str) -> None:
+        """Drop ``key`` from both tiers."""
+        self._memory.pop(key, None)
+        if self.directory:
+            path = self._path(key)
+            if path.exists():
+                path.unlink(missing_ok=True)
+                self._disk_entries -= 1
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        self._memory.clear()
+        if self.directory:
+            for path in self.directory.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+            self._disk_entries = 0
+
+
+def make_client() -> AsyncOpenAI:
+    """Return an OpenAI client configured from the ``OPENAI_*`` settings."""
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY", "test"),
+        base_url=OPENAI_BASE_URL,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=OPENAI_MAX_RETRIES,
+    )
+
+
+class _Flight:
+    """An upstream call other callers with the same key can wait on."""
+
+    def __init__(self) -> None:
+        self.done = anyio.Event()
+        self.content: str | None = None
+        self.error: BaseException | None = None
+
+
+cache = LLMCache()
+_in_flight: dict[str, _Flight] = {}
+
+
+async def complete(
+    client: AsyncOpenAI,
+    model: str,
+    messages: list[dict[str, Any]],
+    *,
+    pipeline: str = "default",
+    **params: Any,
+) -> str:
+    """Return the completion text for the request.
+
+    Served from cache when possible; concurrent identical requests share a
+    single upstream call and its result or error. Every call is reported to
+    :data:`apps.worker.telemetry.calls` under ``pipeline``.
+    """
+    started = time.perf_counter()
+    usage = None
+    status = "error"
+    try:
+        key = cache.key(model, messages, **params)
+        content, tier = cache.lookup(key)
+        if content is not None:
+            status = tier
+            return content
+        while key in _in_flight:
+            flight = _in_flight[key]
+            cache.stats.coalesced += 1
+            await flight.done.wait()
+            if flight.error is None:
+                status = "coalesced"
+                return flight.content
+            if not isinstance(flight.error, anyio.get_cancelled_exc_class()):
+                raise flight.error
+            # the leader was cancelled, not failed: try again ourselves
+
+        flight = _in_flight[key] = _Flight()
+        try:
+            chat = await resilience.guard.call(
+                client.chat.completions.create, model=model, messages=messages, **params
+            )
+            usage = getattr(chat, "usage", None)
+            flight.content = chat.choices[0].message.content
+            cache.set(key, flight.content)
+            status = "upstream"
+            return flight.content
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            del _in_flight[key]
+            flight.done.set()
+    finally:
+        telemetry.calls.record(
+            telemetry.CallRecord(
+                pipeline=pipeline,
+                model=model,
+                status=status,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+                max_tokens=params.get("max_tokens"),
+            )
+        )
+
+
+def forget(model: str, messages: list[dict[str, Any]], **params: Any) -> None:
+    """Evict the cached reply to a request, e.g. one the caller could not parse.
+
+    Takes the same arguments as :func:`complete` minus ``client`` and
+    ``pipeline``, so the retry reaches the model instead of replaying it.
+    """
+    cache.discard(cache.key(model, messages, **params))
+
+
+__all__: list[str] = ["CacheStats", "LLMCache", "cache", "complete", "forget", "make_client"]
@@ -2,10 +2,20 @@
 
 Provides a simple health-check route for now.
 """
-from fastapi import FastAPI, HTTPException
-from openai import AsyncOpenAI, OpenAIError
-import os
-from sqlmodel import Session, select
+import base64
+import json
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from openai import OpenAIError
+import time
+import uuid
+from sqlalchemy import tuple_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import datetime as dt
 
 from .schemas import (
@@ -14,19 +24,47 @@ from .schemas import (
     Flashcard,
     FlashcardsOut,
     FlashcardsDBOut,
+    DeckOut,
     ReviewIn,
     ReviewOut,
     FlashcardDB,
 )
-from packages.core.models import User, Feed, Post, Flashcard as DBFlashcard
+from packages.core.models import CardSchedule, Post, ReviewLog, Flashcard as DBFlashcard
 from packages.core.spaced_repetition import sm2
-from . import engine, init_db
+from packages.db import async_session_maker, get_session
+from . import init_db, init_demo_rows
+from .bulk import (
+    MANUAL_FEED_ID,
+    POST_DONE,
+    flashcard_rows,
+    insert_flashcards_async,
+)
+from .llm import complete, make_client
+from .cardparse import CardParseError, CardStreamParser, parse_cards, validate_cards
+from . import cardparse, llm, resilience, reviews, telemetry
 
 init_db()
 
-app = FastAPI(title="Vibe Coder Flashcards Worker")
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY", "test"))
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """Create the demo rows and run the periodic review flush.
+
+    On shutdown buffered reviews and telemetry are written.
+    """
+    init_demo_rows()  # once per process instead of a lookup per request
+    if reviews.REVIEW_WRITE_BEHIND:
+        reviews.buffer.start()
+    try:
+        yield
+    finally:
+        await reviews.buffer.stop()
+        telemetry.calls.flush()
+
+
+app = FastAPI(title="Vibe Coder Flashcards Worker", lifespan=lifespan)
+
+client = make_client()
 
 
 @app.get("/", include_in_schema=False)
@@ -36,117 +74,254 @@ async def root_health() -> dict[str, str]:
 
 
 @app.get("/health", summary="Health check")
-async def health_check() -> dict[str, str]:
-    """Health-check endpoint used by uptime monitors."""
-    return {"status": "ok"}
+async def health_check() -> dict[str, Any]:
+    """Health-check endpoint used by uptime monitors.
 
+    ``status`` is ``degraded`` while the OpenAI circuit is not closed.
+    """
+    openai = resilience.guard.snapshot()
+    return {
+        "status": "ok" if openai["circuit"] == resilience.CLOSED else "degraded",
+        "openai": openai,
+        "reviews": reviews.buffer.snapshot(),
+    }
 
-@app.post("/summarise", response_model=SummaryOut)
-async def summarise(payload: TextIn) -> SummaryOut:
-    """Return a concise summary of the provided text."""
+
+@app.get("/metrics/llm", summary="LLM call telemetry")
+async def llm_metrics(slowest: int = 10) -> dict[str, Any]:
+    """Latency, token and cost aggregates of recent completions per pipeline."""
+    summary = telemetry.calls.summary(slowest=slowest)
+    summary["parse"] = asdict(cardparse.stats)
+    summary["cache"] = asdict(llm.cache.stats)
+    return summary
+
+
+async def summarise(payload: TextIn, pipeline: str = "summarise") -> SummaryOut:
+    """Return a concise summary of the provided text.
+
+    ``pipeline`` labels the call in telemetry.
+    """
     try:
-        chat = await client.chat.completions.create(
+        content = await complete(
+            client,
             model="gpt-3.5-turbo",  # small cheap model
             messages=[{"role": "user", "content": f"Summarise:\n{payload.text}"}],
+            pipeline=pipeline,
             max_tokens=128,
         )
     except OpenAIError as exc:  # pragma: no cover - network errors are mocked
         raise HTTPException(status_code=502, detail="OpenAI error") from exc
-    return SummaryOut(summary=chat.choices[0].message.content.strip())
+    return SummaryOut(summary=content.strip())
 
 
-@app.post("/flashcards", response_model=FlashcardsDBOut)
-async def generate_flashcards(payload: TextIn) -> FlashcardsDBOut:
-    """Generate Q/A flashcards from input text."""
-    prompt = (
-        "Convert the following text to <=5 study flashcards in JSON array of objects "
-        "with \"question\" & \"answer\" keys only. No extra keys. Text:\n" + payload.text
+@app.post("/summarise", response_model=SummaryOut)
+async def summarise_route(payload: TextIn) -> SummaryOut:
+    """Return a concise summary of the provided text."""
+    return await summarise(payload)
+
+
+def _flashcard_prompt(text: str) -> str:
+    return (
+        'Convert the following text to <=5 study flashcards. Reply with a JSON object {"flashcards": [...]} '
+        'whose array holds objects with "question" & "answer" keys only. No extra keys. Text:\n' + text
     )
+
+
+async def _manual_post(ses: AsyncSession, text: str) -> Post:
+    """Flush the post backing hand-submitted text; the caller commits."""
+    # tweet_id is unique, so every submission needs its own
+    # processed right here, so posts_to_flashcards must not pick it up
+    post = Post(
+        feed_id=MANUAL_FEED_ID,
+        tweet_id=f"manual-{uuid.uuid4().hex}",
+        text=text,
+        processing_state=POST_DONE,
+        processed_at=dt.datetime.utcnow(),
+    )
+    ses.add(post)
+    await ses.flush()
+    return post
+
+
+async def generate_cards(payload: TextIn, pipeline: str = "flashcards") -> FlashcardsOut:
+    """Ask the LLM for flashcards on ``payload.text`` without storing them.
+
+    ``pipeline`` labels the call in telemetry.
+    """
+    request = dict(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": _flashcard_prompt(payload.text)}],
+        max_tokens=256,
+        response_format={"type": "json_object"},
+    )
+    try:
+        cards_data = await complete(client, pipeline=pipeline, **request)
+    except OpenAIError as exc:  # pragma: no cover
+        raise HTTPException(status_code=502, detail="OpenAI error") from exc
+    try:
+        return FlashcardsOut(flashcards=[Flashcard(**c) for c in parse_cards(cards_data)])
+    except CardParseError as exc:
+        llm.forget(**request)  # or every retry would get the same reply back
+        raise HTTPException(status_code=502, detail="Unparseable LLM reply") from exc
+
+
+@app.post("/flashcards", response_model=FlashcardsDBOut)
+async def generate_flashcards(
+    payload: TextIn, ses: AsyncSession = Depends(get_session)
+) -> FlashcardsDBOut:
+    """Generate Q/A flashcards from input text.
+
+    The post and all of its cards are written in one transaction, the cards
+    by a single ``INSERT .. RETURNING`` and their schedules by another.
+    """
+    cards = (await generate_cards(payload)).flashcards
+    post = await _manual_post(ses, payload.text)
+    stored = await insert_flashcards_async(ses, flashcard_rows(post.id, cards))
+    await ses.commit()
+    return FlashcardsDBOut(flashcards=[FlashcardDB(id=r.id, question=r.question, answer=r.answer) for r in stored])
+
+
+@app.post("/flashcards/stream")
+async def stream_flashcards(payload: TextIn) -> StreamingResponse:
+    """Stream flashcards as NDJSON, one line per card as soon as it is stored.
+
+    Uses the streaming completion API and parses the JSON array as it
+    arrives. An upstream failure before the first token is a 502; a failure
+    mid-stream ends the body with an ``{"error": ...}`` line and counts
+    against the circuit breaker. The pinned client cannot ask for token
+    usage on a stream, so these calls are recorded without tokens and left
+    out of the ``/metrics/llm`` cost.
+    """
+    started = time.perf_counter()
     try:
-        chat = await client.chat.completions.create(
+        stream = await resilience.guard.call(
+            client.chat.completions.create,
             model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
+            messages=[{"role": "user", "content": _flashcard_prompt(payload.text)}],
             max_tokens=256,
-            response_format={"type": "json_object"},
+            stream=True,
         )
-    except OpenAIError as exc:  # pragma: no cover
+    except OpenAIError as exc:
         raise HTTPException(status_code=502, detail="OpenAI error") from exc
-    cards_data = chat.choices[0].message.content
-    # simple parse – assumes correct JSON
-    import json
-
-    decoded = json.loads(cards_data)
-    cards = [Flashcard(**c) for c in decoded]
-
-    with Session(engine) as ses:
-        # ensure demo user/feed/post exist
-        user = ses.exec(select(User).where(User.id == 1)).first()
-        if not user:
-            user = User(id=1, email="demo@example.com")
-            ses.add(user)
-        feed = ses.exec(select(Feed).where(Feed.id == 1)).first()
-        if not feed:
-            feed = Feed(id=1, handle="manual")
-            ses.add(feed)
-        post = Post(feed_id=feed.id, tweet_id="manual", text=payload.text)
-        ses.add(post)
-        ses.commit()
-        ses.refresh(post)
-
-        out_cards: list[FlashcardDB] = []
-        for c in cards:
-            db_card = DBFlashcard(
-                owner_id=user.id,
-                post_id=post.id,
-                question=c.question,
-                answer=c.answer,
-            )
-            ses.add(db_card)
-            ses.commit()
-            ses.refresh(db_card)
-            out_cards.append(
-                FlashcardDB(id=db_card.id, question=db_card.question, answer=db_card.answer)
+
+    async def lines():
+        parser = CardStreamParser()
+        # not a dependency: those are closed before a streamed body is sent
+        async with async_session_maker() as ses:
+            post = await _manual_post(ses, payload.text)
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    cards = validate_cards(parser.feed(chunk.choices[0].delta.content or ""))
+                    if not cards:
+                        continue
+                    # commit before sending, so every card the client sees is stored
+                    stored = await insert_flashcards_async(ses, flashcard_rows(post.id, cards))
+                    await ses.commit()
+                    for r in stored:
+                        yield FlashcardDB(id=r.id, question=r.question, answer=r.answer).model_dump_json() + "\n"
+            except OpenAIError:
+                # the guard saw the stream open, not this failure
+                resilience.guard.breaker.record(False)
+                status = "error"
+                yield json.dumps({"error": "OpenAI error"}) + "\n"
+            else:
+                status = "upstream"
+            await ses.commit()  # the post, even if no card arrived
+        telemetry.calls.record(
+            telemetry.CallRecord(
+                pipeline="flashcards_stream",
+                model="gpt-3.5-turbo",
+                status=status,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                max_tokens=256,
             )
-    return FlashcardsDBOut(flashcards=out_cards)
+        )
 
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-@app.get("/deck/today", response_model=FlashcardsDBOut)
-async def deck_today(user_id: int = 1) -> FlashcardsDBOut:
-    """Return flashcards due for review today."""
+
+def _encode_cursor(next_review: dt.date, card_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{next_review.isoformat()}:{card_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[dt.date, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        day, card_id = raw.split(":")
+        return dt.date.fromisoformat(day), int(card_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+@app.get("/deck/today", response_model=DeckOut)
+async def deck_today(
+    user_id: int = 1,
+    limit: int = Query(30, ge=1, le=200),
+    cursor: Optional[str] = None,
+    ses: AsyncSession = Depends(get_session),
+) -> DeckOut:
+    """Return flashcards due for review today, most overdue first.
+
+    Pages are keyset-paginated on ``(next_review, flashcard_id)``, which the
+    ``(user_id, next_review, flashcard_id)`` schedule index serves directly,
+    so deep pages cost the same as the first. Card text is joined in by
+    primary key. Pass ``next_cursor`` back as ``cursor``.
+    """
     today = dt.date.today()
-    with Session(engine) as ses:
-        cards = ses.exec(
-            select(DBFlashcard).where(
-                DBFlashcard.owner_id == user_id,
-                DBFlashcard.next_review <= today,
-            ).limit(30)
-        ).all()
-        out = [
-            FlashcardDB(id=c.id, question=c.question, answer=c.answer) for c in cards
-        ]
-    return FlashcardsDBOut(flashcards=out)
+    query = (
+        select(CardSchedule.flashcard_id, CardSchedule.next_review, DBFlashcard.question, DBFlashcard.answer)
+        .join(DBFlashcard, DBFlashcard.id == CardSchedule.flashcard_id)
+        .where(CardSchedule.user_id == user_id, CardSchedule.next_review <= today)
+    )
+    if cursor:
+        query = query.where(tuple_(CardSchedule.next_review, CardSchedule.flashcard_id) > _decode_cursor(cursor))
+    rows = (
+        await ses.exec(query.order_by(CardSchedule.next_review, CardSchedule.flashcard_id).limit(limit + 1))
+    ).all()
+    page = rows[:limit]
+    out = [FlashcardDB(id=r.flashcard_id, question=r.question, answer=r.answer) for r in page]
+    next_cursor = _encode_cursor(page[-1].next_review, page[-1].flashcard_id) if len(rows) > limit else None
+    return DeckOut(flashcards=out, next_cursor=next_cursor)
 
 
 @app.post("/review", response_model=ReviewOut)
-async def review(payload: ReviewIn) -> ReviewOut:
-    """Update flashcard scheduling based on recall quality."""
-    with Session(engine) as ses:
-        card = ses.get(DBFlashcard, payload.flashcard_id)
-        if not card:
-            raise HTTPException(status_code=404, detail="Flashcard not found")
-
-        next_review, ease, interval, reps = sm2(
-            dt.date.today(),
-            payload.quality,
-            card.ease_factor,
-            card.interval,
-            card.repetitions,
-        )
-        card.next_review = next_review
-        card.ease_factor = ease
-        card.interval = interval
-        card.repetitions = reps
-        ses.add(card)
-        ses.commit()
-        ses.refresh(card)
-    return ReviewOut(id=card.id, next_review=str(card.next_review), interval=card.interval)
+async def review(payload: ReviewIn, ses: AsyncSession = Depends(get_session)) -> ReviewOut:
+    """Update the user's schedule for a flashcard based on recall quality.
+
+    With write-behind on (see :mod:`apps.worker.reviews`) the new schedule is
+    returned at once and written with the next batch.
+    """
+    key = (payload.user_id, payload.flashcard_id)
+    sched = reviews.buffer.peek(*key) if reviews.REVIEW_WRITE_BEHIND else None
+    if sched is None:
+        sched = await ses.get(CardSchedule, key)
+    if not sched:
+        raise HTTPException(status_code=404, detail="Flashcard not found")
+
+    reps, interval, ease = sm2(
+        sched.repetitions,
+        sched.interval,
+        sched.ease_factor,
+        payload.quality,
+    )
+    sched.next_review = dt.date.today() + dt.timedelta(days=interval)
+    sched.ease_factor = ease
+    sched.interval = interval
+    sched.repetitions = reps
+    log = ReviewLog(
+        user_id=sched.user_id,
+        flashcard_id=sched.flashcard_id,
+        quality=payload.quality,
+        ease_factor=ease,
+        interval=interval,
+        repetitions=reps,
+        next_review=sched.next_review,
+    )
+    if reviews.REVIEW_WRITE_BEHIND:
+        await reviews.buffer.add(sched.model_dump(), log.model_dump(exclude={"id"}))
+    else:
+        ses.add_all([sched, log])
+        await ses.commit()
+    return ReviewOut(id=sched.flashcard_id, next_review=str(sched.next_review), interval=sched.interval)
@@ -1,43 +1,285 @@
 """Pipeline: convert new posts to flashcards via OpenAI."""
 from __future__ import annotations
 
-import json
+import math
+import os
+import time
+from dataclasses import dataclass, field
+
+import anyio
+from anyio.abc import TaskGroup
 from loguru import logger
-from openai import AsyncOpenAI
+from openai import OpenAIError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlmodel import Session, select
 
-from packages.core.models import Post, Flashcard
+from packages.core.models import Post
 from apps.worker import engine
+from apps.worker.bulk import POST_DONE, POST_FAILED, POST_PENDING, flashcard_rows, insert_flashcards, mark_posts
+from apps.worker.cardparse import CardParseError, decode_reply, parse_cards, validate_cards
+from apps.worker.llm import complete, forget, make_client
+from apps.worker.resilience import CircuitOpenError
+
+client = make_client()
+
+# posts converted at the same time
+FLASHCARD_CONCURRENCY = int(os.environ.get("FLASHCARD_CONCURRENCY", "4"))
+FLASHCARD_RETRIES = int(os.environ.get("FLASHCARD_RETRIES", "3"))
+FLASHCARD_RETRY_BASE_SECONDS = float(os.environ.get("FLASHCARD_RETRY_BASE_SECONDS", "1"))
+# packed mode: several short posts per request, bounded by an estimated prompt size
+FLASHCARD_PACKED = os.environ.get("FLASHCARD_PACKED", "0") == "1"
+PACK_TOKEN_BUDGET = int(os.environ.get("FLASHCARD_PACK_TOKEN_BUDGET", "1500"))
+PACK_MAX_POSTS = int(os.environ.get("FLASHCARD_PACK_MAX_POSTS", "10"))
+# completion tokens reserved per post in a packed request, same as a single call
+TOKENS_PER_POST_REPLY = 256
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one :func:`posts_to_flashcards` batch."""
+
+    created: int = 0  # flashcards written
+    failed: int = 0  # posts given up on
+    deferred: int = 0  # posts left pending for a later batch
+    skipped: int = 0  # posts whose reply held no cards
+    requests: int = 0  # LLM requests issued, packed or single
+    fallbacks: int = 0  # posts re-sent alone after a packed reply missed them
+    latencies: list[float] = field(default_factory=list)  # seconds per post, retries included
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile of the per-post latencies."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(50)
+
+    @property
+    def p95(self) -> float:
+        return self.percentile(95)
+
+    @property
+    def p99(self) -> float:
+        return self.percentile(99)
+
+
+def _prompt(text: str) -> str:
+    return (
+        'Convert the following text to <=5 study flashcards. Reply with a JSON object {"flashcards": [...]} '
+        'whose array holds objects with "question" & "answer" keys only. No extra keys. Text:\n' + text
+    )
+
+
+def _request(prompt: str, max_tokens: int) -> dict:
+    """Arguments of one JSON completion, shared by :func:`_complete` and :func:`forget`."""
+    return dict(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        response_format={"type": "json_object"},
+    )
+
+
+async def _complete(prompt: str, max_tokens: int, retries: int, pipeline: str = "posts_to_flashcards") -> str:
+    """Run one JSON completion, retrying upstream errors with backoff."""
+    attempt = 0
+    while True:
+        try:
+            return await complete(client, pipeline=pipeline, **_request(prompt, max_tokens))
+        except CircuitOpenError:
+            raise
+        except OpenAIError:
+            if attempt >= retries:
+                raise
+            await anyio.sleep(FLASHCARD_RETRY_BASE_SECONDS * 2**attempt)
+            attempt += 1
+
+
+async def _cards_for(text: str, retries: int) -> list[dict]:
+    """Return validated card dicts for ``text``."""
+    prompt = _prompt(text)
+    reply = await _complete(prompt, 256, retries)
+    try:
+        return parse_cards(reply)
+    except CardParseError:
+        forget(**_request(prompt, 256))  # not replayed to the next caller with the same prompt
+        raise
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt token count (~4 characters per token)."""
+    return len(text) // 4 + 8
 
-client = AsyncOpenAI()
 
+def pack(
+    posts: list[tuple[int, str]],
+    budget: int = PACK_TOKEN_BUDGET,
+    max_posts: int = PACK_MAX_POSTS,
+) -> list[list[tuple[int, str]]]:
+    """Greedily group ``posts`` so each group's estimated prompt fits ``budget``."""
+    groups: list[list[tuple[int, str]]] = []
+    current: list[tuple[int, str]] = []
+    used = 0
+    for post in posts:
+        cost = estimate_tokens(post[1])
+        if current and (used + cost > budget or len(current) >= max_posts):
+            groups.append(current)
+            current, used = [], 0
+        current.append(post)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
 
-async def posts_to_flashcards(batch_size: int = 10) -> int:  # noqa: D401
-    """Generate flashcards for latest posts without cards.
 
-    Returns number of cards created.
+def _packed_prompt(group: list[tuple[int, str]]) -> str:
+    posts = "\n".join(f"[{post_id}] {text}" for post_id, text in group)
+    return (
+        "Convert each of the following posts to <=5 study flashcards. Reply with a JSON object "
+        "mapping every post id (the number in brackets, as a string) to an array of objects "
+        'with "question" & "answer" keys only. No extra keys. Posts:\n' + posts
+    )
+
+
+def _valid_cards(raw: object) -> list[dict] | None:
+    """Return the valid cards in ``raw``, or ``None`` if it holds none of the cards asked for."""
+    if not isinstance(raw, list):
+        return None
+    cards = validate_cards(raw)
+    return cards if cards or not raw else None
+
+
+async def _packed_cards_for(group: list[tuple[int, str]], retries: int) -> dict[int, list[dict]]:
+    """Return validated cards per post id; posts missing from the reply are left out."""
+    max_tokens = min(TOKENS_PER_POST_REPLY * len(group), 4096)
+    prompt = _packed_prompt(group)
+    try:
+        decoded = decode_reply(await _complete(prompt, max_tokens, retries, "posts_to_flashcards.packed"))
+    except CardParseError:
+        forget(**_request(prompt, max_tokens))
+        return {}
+    if not isinstance(decoded, dict):
+        return {}
+    out: dict[int, list[dict]] = {}
+    for post_id, _ in group:
+        cards = _valid_cards(decoded.get(str(post_id)))
+        if cards is not None:
+            out[post_id] = cards
+    return out
+
+
+def _store(post_id: int, raw_cards: list[dict]) -> int:
+    """Commit one post's cards and mark it done in their own transaction."""
+    with Session(engine) as ses:
+        insert_flashcards(ses, flashcard_rows(post_id, raw_cards))
+        mark_posts(ses, [post_id], POST_DONE)
+        ses.commit()
+    return len(raw_cards)
+
+
+async def posts_to_flashcards(
+    batch_size: int = 10,
+    concurrency: int = FLASHCARD_CONCURRENCY,
+    retries: int = FLASHCARD_RETRIES,
+    packed: bool = FLASHCARD_PACKED,
+) -> BatchResult:  # noqa: D401
+    """Generate flashcards for pending posts, oldest first.
+
+    Posts are converted concurrently (at most ``concurrency`` requests at
+    once) and each post's cards are committed on their own, so one failure
+    only loses that post. A post ends up done (even with no cards) or
+    failed once its retries run out; posts the open circuit rejected or
+    whose state could not be written stay pending for a later batch. With
+    ``packed`` several posts share one request (see :func:`pack`); posts
+    the reply misses or mangles are retried alone. Returns a
+    :class:`BatchResult`.
     """
-    created = 0
     with Session(engine) as ses:
+        # a range scan of ix_post_unprocessed, however many posts are already done
         posts = ses.exec(
-            select(Post).where(~Post.id.in_(select(Flashcard.post_id))).limit(batch_size)
+            select(Post.id, Post.text)
+            .where(Post.processing_state == POST_PENDING)
+            .order_by(Post.id)
+            .limit(batch_size)
         ).all()
-        for p in posts:
-            prompt = (
-                "Convert the following text to <=5 study flashcards in JSON array of objects "
-                'with "question" & "answer" keys only. No extra keys. Text:\n' + p.text
-            )
-            chat = await client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=256,
-                response_format={"type": "json_object"},
-            )
-            cards_data = chat.choices[0].message.content
-            for raw in json.loads(cards_data):
-                card = Flashcard(post_id=p.id, owner_id=1, question=raw["question"], answer=raw["answer"])
-                ses.add(card)
-                created += 1
-        ses.commit()
-    logger.info(f"Created {created} flashcards")
-    return created
+
+    result = BatchResult()
+    limiter = anyio.CapacityLimiter(max(1, concurrency))
+
+    def record(post_id: int, raw_cards: list[dict]) -> None:
+        try:
+            created = _store(post_id, raw_cards)
+        except SQLAlchemyError as exc:
+            logger.warning(f"Post {post_id} left pending, storing its cards failed: {exc!r}")
+            result.deferred += 1
+            return
+        result.created += created
+        result.skipped += created == 0
+
+    def give_up(post_id: int) -> None:
+        try:
+            with Session(engine) as ses:
+                mark_posts(ses, [post_id], POST_FAILED)
+                ses.commit()
+        except SQLAlchemyError as exc:
+            logger.warning(f"Post {post_id} left pending, marking it failed did not commit: {exc!r}")
+            result.deferred += 1
+            return
+        result.failed += 1
+
+    async def convert(post_id: int, text: str, started: float) -> None:
+        try:
+            result.requests += 1
+            record(post_id, await _cards_for(text, retries))
+        except CircuitOpenError as exc:
+            # not the post's fault: leave it pending for a later batch
+            logger.warning(f"Post {post_id} deferred: {exc!r}")
+            result.deferred += 1
+        except (OpenAIError, ValueError, KeyError, TypeError) as exc:
+            logger.warning(f"Post {post_id} failed: {exc!r}")
+            give_up(post_id)
+        finally:
+            result.latencies.append(time.perf_counter() - started)
+
+    async def convert_single(post_id: int, text: str, started: float | None = None) -> None:
+        async with limiter:
+            await convert(post_id, text, time.perf_counter() if started is None else started)
+
+    async def convert_group(group: list[tuple[int, str]], tg: TaskGroup) -> None:
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                result.requests += 1
+                by_post = await _packed_cards_for(group, retries)
+            except OpenAIError as exc:
+                logger.warning(f"Packed request for {[p for p, _ in group]} failed: {exc!r}")
+                by_post = {}
+        for post_id, text in group:
+            if post_id in by_post:
+                record(post_id, by_post[post_id])
+                result.latencies.append(time.perf_counter() - started)
+            else:
+                # each fallback waits for its own slot rather than holding the group's
+                result.fallbacks += 1
+                tg.start_soon(convert_single, post_id, text, started)
+
+    async with anyio.create_task_group() as tg:
+        if packed:
+            for group in pack(list(posts)):
+                if len(group) == 1:
+                    tg.start_soon(convert_single, *group[0])
+                else:
+                    tg.start_soon(convert_group, group, tg)
+        else:
+            for post_id, text in posts:
+                tg.start_soon(convert_single, post_id, text)
+
+    logger.info(
+        f"Created {result.created} flashcards from {len(posts)} posts in {result.requests} requests "
+        f"({result.failed} failed, {result.deferred} deferred, {result.skipped} empty, "
+        f"{result.fallbacks} fallbacks; p50 {result.p50:.2f}s p95 {result.p95:.2f}s)"
+    )
+    return result
@@ -0,0 +1,206 @@
+"""Pipeline stage: DB-backed queue between ingestion and LLM summarisation.
+
+Ingestion only enqueues a :class:`PostJob` per new post. Consumers lease
+jobs with ``FOR UPDATE SKIP LOCKED`` so any number of workers can share the
+queue, run summarise → flashcards at their own concurrency and retry
+failures with exponential backoff.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import os
+
+import anyio
+from loguru import logger
+from sqlalchemy import or_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, select
+
+from packages.core.models import Post, PostJob
+from apps.worker import engine, init_demo_rows, resilience
+from apps.worker.bulk import (
+    POST_DONE,
+    POST_FAILED,
+    POST_QUEUED,
+    flashcard_rows,
+    insert_flashcards,
+    insert_ignore,
+    mark_posts,
+)
+from apps.worker.main import generate_cards, summarise, TextIn
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# number of jobs processed at the same time per worker process
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "4"))
+# a leased job not finished within this window is handed to another consumer
+LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.environ.get("JOB_RETRY_BASE_SECONDS", "30"))
+
+
+def enqueue_posts(session: Session, post_ids: list[int]) -> None:
+    """Queue LLM work for ``post_ids``; the caller commits with the posts.
+
+    The posts move to the queued state, so ``posts_to_flashcards`` running
+    next to the consumers does not convert them a second time.
+    """
+    if not post_ids:
+        return
+    session.execute(update(Post).where(Post.id.in_(post_ids)).values(processing_state=POST_QUEUED))
+    now = dt.datetime.utcnow()
+    rows = [
+        {"post_id": pid, "status": PENDING, "attempts": 0, "available_at": now, "created_at": now}
+        for pid in post_ids
+    ]
+    session.execute(insert_ignore(session, PostJob, ["post_id"]).values(rows))
+
+
+def claim_jobs(limit: int = 1, lease_seconds: int = LEASE_SECONDS) -> list[tuple[PostJob, str]]:
+    """Lease up to ``limit`` runnable jobs and return them with their post text."""
+    now = dt.datetime.utcnow()
+    with Session(engine) as session:
+        runnable = (
+            select(PostJob.id)
+            .where(
+                or_(
+                    (PostJob.status == PENDING) & (PostJob.available_at <= now),
+                    (PostJob.status == LEASED) & (PostJob.lease_until < now),
+                )
+            )
+            .order_by(PostJob.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = session.execute(
+            update(PostJob)
+            .where(PostJob.id.in_(runnable.scalar_subquery()))
+            .values(
+                status=LEASED,
+                lease_until=now + dt.timedelta(seconds=lease_seconds),
+                attempts=PostJob.attempts + 1,
+            )
+            .returning(PostJob.id, PostJob.post_id, PostJob.attempts)
+        ).all()
+        texts = dict(
+            session.exec(select(Post.id, Post.text).where(Post.id.in_([c.post_id for c in claimed]))).all()
+        )
+        session.commit()
+    return [
+        (PostJob(id=c.id, post_id=c.post_id, attempts=c.attempts, status=LEASED), texts[c.post_id])
+        for c in sorted(claimed, key=lambda c: c.id)
+    ]
+
+
+def _settle(session: Session, job: PostJob, **values) -> bool:
+    """Update ``job`` only while this consumer still holds its lease.
+
+    A consumer whose lease ran out may finish after the job was reclaimed;
+    the ``attempts`` fence makes its late write a no-op.
+    """
+    result = session.execute(
+        update(PostJob)
+        .where(PostJob.id == job.id, PostJob.attempts == job.attempts, PostJob.status == LEASED)
+        .values(lease_until=None, **values)
+    )
+    return result.rowcount == 1
+
+
+def _finish(job: PostJob, cards: list) -> bool:
+    """Mark the job done and store the cards in one transaction, if the lease is still ours."""
+    with Session(engine) as session:
+        if not _settle(session, job, status=DONE, last_error=None):
+            logger.warning(f"Job {job.id} lost its lease (attempt {job.attempts}), dropping its cards")
+            return False
+        insert_flashcards(session, flashcard_rows(job.post_id, cards))
+        mark_posts(session, [job.post_id], POST_DONE)
+        session.commit()
+    return True
+
+
+def _fail(job: PostJob, error: str) -> None:
+    """Reschedule ``job`` with exponential backoff, or give up on it."""
+    if job.attempts >= MAX_ATTEMPTS:
+        values = {"status": FAILED}
+    else:
+        delay = RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+        values = {"status": PENDING, "available_at": dt.datetime.utcnow() + dt.timedelta(seconds=delay)}
+    with Session(engine) as session:
+        if not _settle(session, job, last_error=error[:500], **values):
+            return
+        if values["status"] == FAILED:
+            mark_posts(session, [job.post_id], POST_FAILED)
+        session.commit()
+
+
+async def process_job(job: PostJob, text: str) -> bool:
+    """Run summarise → flashcards for one leased job. Returns success."""
+    try:
+        summary = await summarise(TextIn(text=text), pipeline="jobs.summarise")
+        cards = await generate_cards(TextIn(text=summary.summary), pipeline="jobs.flashcards")
+    except Exception as exc:  # noqa: BLE001 - any failure is retried
+        logger.warning(f"Job {job.id} for post {job.post_id} failed (attempt {job.attempts}): {exc!r}")
+        _fail(job, repr(exc))
+        return False
+    return _finish(job, cards.flashcards)
+
+
+async def run_consumers(
+    concurrency: int = LLM_CONCURRENCY,
+    drain: bool = False,
+    idle_seconds: float = 5.0,
+) -> int:
+    """Run ``concurrency`` consumers over the queue.
+
+    With ``drain`` the consumers return once no runnable job is left,
+    otherwise they poll every ``idle_seconds`` forever. A database error
+    pauses one consumer for ``idle_seconds``; a job it held is reclaimed once
+    its lease expires. Returns the number of jobs completed successfully.
+    """
+    done = 0
+
+    async def consumer() -> None:
+        nonlocal done
+        while True:
+            if resilience.guard.rejecting():
+                # leave jobs queued rather than burn their attempts on an open circuit
+                await anyio.sleep(min(idle_seconds, resilience.guard.breaker.retry_in()))
+                continue
+            try:
+                claimed = claim_jobs(1)
+            except SQLAlchemyError as exc:
+                logger.warning(f"Claiming a job failed, retrying in {idle_seconds}s: {exc!r}")
+                await anyio.sleep(idle_seconds)
+                continue
+            if not claimed:
+                if drain:
+                    return
+                await anyio.sleep(idle_seconds)
+                continue
+            for job, text in claimed:
+                try:
+                    # await first: ``done += await ...`` reads ``done`` before suspending
+                    ok = await process_job(job, text)
+                except SQLAlchemyError as exc:
+                    logger.warning(f"Settling job {job.id} failed, it is retried after its lease: {exc!r}")
+                    await anyio.sleep(idle_seconds)
+                    continue
+                done += ok
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(max(1, concurrency)):
+            tg.start_soon(consumer)
+    return done
+
+
+def main() -> None:  # pragma: no cover - manual run
+    """CLI entrypoint for running the LLM consumers."""
+    init_demo_rows()  # new cards are scheduled for the demo user
+    anyio.run(run_consumers)
+
+
+if __name__ == "__main__":  # pragma: no cover - manual run
+    main()
@@ -0,0 +1,113 @@
+"""Adaptive per-feed polling schedule.
+
+Each feed is polled roughly as often as it posts: the posting rate is
+learned from ``Post.created_at`` over a lookback window and turned into an
+interval clamped to ``[POLL_MIN_SECONDS, POLL_MAX_SECONDS]``. Due feeds are
+kept in a heap so the loop always sleeps until the next one.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import heapq
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+import anyio
+from loguru import logger
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from packages.core.models import Feed, Post
+from apps.worker import engine
+
+POLL_MIN_SECONDS = float(os.environ.get("POLL_MIN_SECONDS", str(5 * 60)))
+POLL_MAX_SECONDS = float(os.environ.get("POLL_MAX_SECONDS", str(6 * 60 * 60)))
+# history used to estimate how often a feed posts
+POLL_LOOKBACK = dt.timedelta(days=int(os.environ.get("POLL_LOOKBACK_DAYS", "14")))
+# expected new posts per poll; lower polls more eagerly
+POLL_TARGET_POSTS = float(os.environ.get("POLL_TARGET_POSTS", "0.5"))
+
+
+def estimate_interval(
+    post_count: int,
+    lookback: dt.timedelta = POLL_LOOKBACK,
+    target_posts: float = POLL_TARGET_POSTS,
+    min_seconds: float = POLL_MIN_SECONDS,
+    max_seconds: float = POLL_MAX_SECONDS,
+) -> float:
+    """Return the poll interval for a feed with ``post_count`` posts in ``lookback``."""
+    if post_count <= 0:
+        return max_seconds
+    interval = lookback.total_seconds() / post_count * target_posts
+    return min(max(interval, min_seconds), max_seconds)
+
+
+def learn_intervals(handles: list[str], now: dt.datetime | None = None) -> dict[str, float]:
+    """Return the adaptive interval for every handle from recent post history."""
+    now = now or dt.datetime.utcnow()
+    with Session(engine) as ses:
+        counts = dict(
+            ses.exec(
+                select(Feed.handle, func.count(Post.id))
+                .join(Post, Post.feed_id == Feed.id)
+                .where(Feed.handle.in_(handles), Post.created_at >= now - POLL_LOOKBACK)
+                .group_by(Feed.handle)
+            ).all()
+        )
+    return {h: estimate_interval(counts.get(h, 0)) for h in handles}
+
+
+class AdaptivePoller:
+    """Poll handles through ``poll`` whenever they fall due."""
+
+    def __init__(
+        self,
+        handles: list[str],
+        poll: Callable[[list[str]], Awaitable[Any]],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.poll = poll
+        self.clock = clock
+        self.intervals: dict[str, float] = {}
+        # every handle is due immediately on start
+        self._heap: list[tuple[float, str]] = [(clock(), h) for h in dict.fromkeys(handles)]
+        heapq.heapify(self._heap)
+
+    def due(self) -> list[str]:
+        """Pop and return every handle whose next poll time has passed."""
+        now = self.clock()
+        handles: list[str] = []
+        while self._heap and self._heap[0][0] <= now:
+            handles.append(heapq.heappop(self._heap)[1])
+        return handles
+
+    def reschedule(self, handles: list[str]) -> None:
+        """Push ``handles`` back with freshly learned intervals."""
+        now = self.clock()
+        self.intervals.update(learn_intervals(handles))
+        for h in handles:
+            heapq.heappush(self._heap, (now + self.intervals[h], h))
+
+    def next_wait(self) -> float:
+        """Seconds until the next handle falls due."""
+        return max(self._heap[0][0] - self.clock(), 0.0) if self._heap else POLL_MAX_SECONDS
+
+    async def run(self, max_rounds: int | None = None) -> None:
+        """Poll forever (or ``max_rounds`` times) as handles fall due."""
+        rounds = 0
+        while True:
+            handles = self.due()
+            if handles:
+                try:
+                    await self.poll(handles)
+                finally:
+                    self.reschedule(handles)
+                logger.info(f"Polled {handles}; next poll in {self.next_wait():.0f}s")
+                rounds += 1
+                if max_rounds is not None and rounds >= max_rounds:
+                    return
+            await anyio.sleep(self.next_wait())
+
+
+__all__: list[str] = ["AdaptivePoller", "estimate_interval", "learn_intervals"]
@@ -0,0 +1,208 @@
+"""Back-pressure around upstream OpenAI calls.
+
+:class:`UpstreamGuard` combines an AIMD concurrency limiter with a circuit
+breaker. The limit grows by about one slot per round of fast successes and
+halves on upstream failures or slow replies, so the worker backs off on its
+own when OpenAI degrades. After ``BREAKER_FAILURE_THRESHOLD`` consecutive
+failures, slow replies included, the circuit opens and calls fail immediately with
+:class:`CircuitOpenError` instead of waiting out the client timeout; after
+``BREAKER_RESET_SECONDS`` a single probe is let through (half-open) and its
+outcome closes or re-opens the circuit.
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+import anyio
+from loguru import logger
+from openai import APIConnectionError, InternalServerError, OpenAIError, RateLimitError
+
+T = TypeVar("T")
+
+LLM_MIN_CONCURRENCY = int(os.environ.get("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_INITIAL_CONCURRENCY = int(os.environ.get("LLM_INITIAL_CONCURRENCY", "8"))
+# replies slower than this count as congestion and shrink the limit
+LLM_LATENCY_TARGET_SECONDS = float(os.environ.get("LLM_LATENCY_TARGET_SECONDS", "10"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# errors that say the upstream, not the request, is the problem
+UPSTREAM_ERRORS = (APIConnectionError, InternalServerError, RateLimitError)
+
+
+class CircuitOpenError(OpenAIError):
+    """Raised instead of calling OpenAI while the circuit is open."""
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted by additive increase / multiplicative decrease."""
+
+    def __init__(
+        self,
+        initial: int = LLM_INITIAL_CONCURRENCY,
+        minimum: int = LLM_MIN_CONCURRENCY,
+        maximum: int = LLM_MAX_CONCURRENCY,
+        latency_target: float = LLM_LATENCY_TARGET_SECONDS,
+        decrease_factor: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._released: anyio.Event | None = None  # created inside the event loop
+
+    async def acquire(self) -> float:
+        """Wait for a free slot; returns the start time to pass to :meth:`release`."""
+        while self.in_flight >= int(self.limit):
+            if self._released is None:
+                self._released = anyio.Event()
+            await self._released.wait()
+        self.in_flight += 1
+        return self._clock()
+
+    def elapsed(self, started: float) -> float:
+        """Seconds since ``started``, as returned by :meth:`acquire`."""
+        return self._clock() - started
+
+    def release(self, started: float, ok: bool | None) -> None:
+        """Free a slot and adapt the limit to how the call went (``None``: leave it)."""
+        self.in_flight -= 1
+        now = self._clock()
+        if ok and now - started <= self.latency_target:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        elif ok is not None and started >= self._last_decrease:
+            # only calls started after the last cut may cut again, so a burst
+            # of failures from one overloaded window halves the limit once
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            self._last_decrease = now
+        if self._released is not None:
+            self._released.set()
+            self._released = None
+
+
+class CircuitBreaker:
+    """Closed → open after repeated failures → half-open probe → closed."""
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._clock = clock
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit lets a probe through (0 if not open)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_seconds - self._clock())
+
+    def allow(self) -> bool:
+        """Return whether a call may go upstream now, claiming the probe if half-open."""
+        if self.state == OPEN and self.retry_in() == 0:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Give up a half-open probe without an outcome."""
+        self._probing = False
+
+    def record(self, ok: bool) -> None:
+        self._probing = False
+        if ok:
+            if self.state != CLOSED:
+                logger.info("OpenAI circuit closed")
+            self.state, self.failures = CLOSED, 0
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"OpenAI circuit opened after {self.failures} failures")
+            self.state, self.opened_at = OPEN, self._clock()
+
+
+class UpstreamGuard:
+    """Run upstream calls through an :class:`AdaptiveLimiter` and a :class:`CircuitBreaker`."""
+
+    def __init__(self, limiter: AdaptiveLimiter | None = None, breaker: CircuitBreaker | None = None) -> None:
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.rejected = 0
+
+    def rejecting(self) -> bool:
+        """True while the circuit is open and no probe is due."""
+        return self.breaker.state == OPEN and self.breaker.retry_in() > 0
+
+    async def call(self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        """Await ``fn(*args, **kwargs)`` unless the circuit is open."""
+        if self.rejecting():
+            self.rejected += 1
+            raise CircuitOpenError(f"OpenAI circuit open, retry in {self.breaker.retry_in():.0f}s")
+        started = await self.limiter.acquire()
+        ok: bool | None = None
+        try:
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError("OpenAI circuit open")
+            try:
+                result = await fn(*args, **kwargs)
+            except UPSTREAM_ERRORS:
+                ok = False
+                self.breaker.record(False)
+                raise
+            except BaseException:
+                # a bad request or a cancellation says nothing about the upstream
+                self.breaker.release_probe()
+                raise
+            ok = True
+            # a reply slower than the target is served but still counts against the upstream
+            self.breaker.record(self.limiter.elapsed(started) <= self.limiter.latency_target)
+            return result
+        finally:
+            self.limiter.release(started, ok)
+
+    def snapshot(self) -> dict[str, Any]:
+        """State for the health endpoint."""
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_in_seconds": round(self.breaker.retry_in(), 1),
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "rejected": self.rejected,
+        }
+
+
+guard = UpstreamGuard()
+
+
+__all__: list[str] = [
+    "AdaptiveLimiter",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "UpstreamGuard",
+    "guard",
+]
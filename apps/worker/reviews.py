@@ -0,0 +1,175 @@
+"""Write-behind batching of ``/review`` schedule updates.
+
+With ``REVIEW_WRITE_BEHIND=1`` the route applies SM-2 at once and hands the
+new :class:`~packages.core.models.CardSchedule` values plus a
+:class:`~packages.core.models.ReviewLog` row to :data:`buffer`, which writes
+them in one transaction per batch: when ``REVIEW_FLUSH_SIZE`` reviews are
+waiting, every ``REVIEW_FLUSH_SECONDS`` and on shutdown. Later reviews of a
+buffered card read its state from the buffer; ``/deck/today`` only sees it
+once written.
+
+``REVIEW_DURABILITY`` picks the trade-off: ``buffered`` answers before the
+batch is written, so a crash loses up to one flush interval of reviews;
+``group`` holds each answer until its batch has committed, which still saves
+the per-review commits but adds up to one interval of latency.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any
+
+import anyio
+from loguru import logger
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from packages.core.models import CardSchedule, ReviewLog
+from packages.db import async_session_maker
+
+REVIEW_WRITE_BEHIND = os.environ.get("REVIEW_WRITE_BEHIND", "0") == "1"
+REVIEW_FLUSH_SIZE = int(os.environ.get("REVIEW_FLUSH_SIZE", "100"))
+REVIEW_FLUSH_SECONDS = float(os.environ.get("REVIEW_FLUSH_SECONDS", "1"))
+# buffered | group
+REVIEW_DURABILITY = os.environ.get("REVIEW_DURABILITY", "buffered")
+
+BUFFERED = "buffered"
+GROUP = "group"
+
+Key = tuple[int, int]  # (user_id, flashcard_id)
+
+
+class _Batch:
+    """Reviews written together; ``retry`` is where they went if the write failed."""
+
+    def __init__(self) -> None:
+        self.schedules: dict[Key, dict[str, Any]] = {}
+        self.log: list[dict[str, Any]] = []
+        self.committed = False
+        self.retry: _Batch | None = None
+        self._done: anyio.Event | None = None  # created inside the event loop
+
+    @property
+    def done(self) -> anyio.Event:
+        if self._done is None:
+            self._done = anyio.Event()
+        return self._done
+
+    def finish(self) -> None:
+        if self._done is not None:
+            self._done.set()
+
+
+class ReviewBuffer:
+    """Latest schedule per ``(user, card)`` and the review log, flushed in batches."""
+
+    def __init__(
+        self,
+        flush_size: int = REVIEW_FLUSH_SIZE,
+        flush_seconds: float = REVIEW_FLUSH_SECONDS,
+        durability: str = REVIEW_DURABILITY,
+    ) -> None:
+        if durability not in (BUFFERED, GROUP):
+            raise ValueError(f"Unknown review durability {durability!r}")
+        self.flush_size = max(1, flush_size)
+        self.flush_seconds = flush_seconds
+        self.durability = durability
+        self.flushes = 0
+        self.written = 0
+        self._batch = _Batch()
+        self._flushing: list[_Batch] = []  # swapped out, not committed yet
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._batch.log)
+
+    def peek(self, user_id: int, flashcard_id: int) -> CardSchedule | None:
+        """Buffered schedule of a card, newest first, or ``None`` to read the DB."""
+        for batch in [self._batch, *reversed(self._flushing)]:
+            values = batch.schedules.get((user_id, flashcard_id))
+            if values is not None:
+                return CardSchedule(**values)
+        return None
+
+    async def add(self, schedule: dict[str, Any], log: dict[str, Any]) -> None:
+        """Queue one review; in ``group`` mode return once it is committed."""
+        batch = self._batch
+        batch.schedules[(schedule["user_id"], schedule["flashcard_id"])] = schedule
+        batch.log.append(log)
+        if len(batch.log) >= self.flush_size:
+            await self.flush()
+        if self.durability == GROUP:
+            while not batch.committed:
+                # a failed batch is finished before anyone may have waited on it
+                if batch.retry is not None:
+                    batch = batch.retry
+                    continue
+                await batch.done.wait()
+
+    async def flush(self) -> int:
+        """Write the current batch in one transaction; returns the reviews written."""
+        batch = self._batch
+        if not batch.log:
+            return 0
+        self._batch = _Batch()
+        self._flushing.append(batch)
+        try:
+            async with async_session_maker() as ses:
+                await ses.execute(update(CardSchedule), list(batch.schedules.values()))
+                await ses.execute(insert(ReviewLog), batch.log)
+                await ses.commit()
+        except BaseException as exc:
+            # back into the buffer: newer values for the same card win, the log keeps its order
+            for key, values in batch.schedules.items():
+                self._batch.schedules.setdefault(key, values)
+            self._batch.log[:0] = batch.log
+            batch.retry = self._batch
+            if not isinstance(exc, SQLAlchemyError):
+                raise
+            logger.warning(f"Review flush of {len(batch.log)} rows failed, retrying next flush: {exc!r}")
+            return 0
+        else:
+            batch.committed = True
+            self.flushes += 1
+            self.written += len(batch.log)
+            return len(batch.log)
+        finally:
+            self._flushing.remove(batch)
+            batch.finish()
+
+    async def run(self) -> None:
+        """Flush every ``flush_seconds`` until cancelled."""
+        while True:
+            await anyio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self) -> None:
+        """Start the periodic flush on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict[str, Any]:
+        """State for the health endpoint."""
+        return {
+            "buffered": len(self),
+            "flushes": self.flushes,
+            "written": self.written,
+            "durability": self.durability,
+        }
+
+
+buffer = ReviewBuffer()
+
+
+__all__: list[str] = ["REVIEW_WRITE_BEHIND", "ReviewBuffer", "buffer"]
@@ -1,5 +1,5 @@
 """Pydantic models shared across the worker module."""
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -45,10 +45,17 @@ class FlashcardsDBOut(BaseModel):
     flashcards: List[FlashcardDB]
 
 
+class DeckOut(FlashcardsDBOut):
+    """A page of due flashcards, most overdue first."""
+
+    next_cursor: Optional[str] = Field(None, description="Pass as ``cursor`` to fetch the next page")
+
+
 class ReviewIn(BaseModel):
     """Payload for reviewing a flashcard."""
 
     flashcard_id: int = Field(..., example=1)
+    user_id: int = Field(1, example=1)
     quality: int = Field(..., ge=0, le=5, example=5)
 
 
@@ -0,0 +1,157 @@
+"""Per-call LLM telemetry: latency, token usage and estimated cost.
+
+:func:`apps.worker.llm.complete` reports every completion to :data:`calls`, including
+cache hits and coalesced calls. The last ``LLM_TELEMETRY_WINDOW`` calls are
+kept in memory and summarised per pipeline and model by :meth:`Telemetry.summary`;
+with ``LLM_TELEMETRY_DB=1`` they are also written, in batches, to the
+``llmcall`` table for longer-term analysis.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import math
+import os
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session
+
+from packages.core.models import LLMCall
+from apps.worker import engine
+
+LLM_TELEMETRY_WINDOW = int(os.environ.get("LLM_TELEMETRY_WINDOW", "2000"))
+LLM_TELEMETRY_DB = os.environ.get("LLM_TELEMETRY_DB", "0") == "1"
+LLM_TELEMETRY_FLUSH_SIZE = int(os.environ.get("LLM_TELEMETRY_FLUSH_SIZE", "50"))
+
+# USD per 1K (prompt, completion) tokens
+PRICES_PER_1K: dict[str, tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.005, 0.015),
+}
+
+# statuses that did not reach OpenAI and cost nothing
+FREE_STATUSES = ("memory", "disk", "coalesced")
+
+
+def cost(model: str, prompt_tokens: int | None, completion_tokens: int | None) -> float:
+    """Estimated USD cost of a call; unknown models cost 0."""
+    prompt_price, completion_price = PRICES_PER_1K.get(model, (0.0, 0.0))
+    return ((prompt_tokens or 0) * prompt_price + (completion_tokens or 0) * completion_price) / 1000
+
+
+@dataclass
+class CallRecord:
+    """One completion as seen by the worker."""
+
+    pipeline: str
+    model: str
+    status: str  # upstream | memory | disk | coalesced | error
+    latency_ms: float
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    max_tokens: int | None = None
+    created_at: dt.datetime = field(default_factory=dt.datetime.utcnow)
+
+    @property
+    def cost(self) -> float:
+        return cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+
+def _percentile(ordered: list[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class Telemetry:
+    """Rolling window of :class:`CallRecord` with optional DB persistence."""
+
+    def __init__(
+        self,
+        window: int = LLM_TELEMETRY_WINDOW,
+        persist: bool = LLM_TELEMETRY_DB,
+        flush_size: int = LLM_TELEMETRY_FLUSH_SIZE,
+    ) -> None:
+        self.records: deque[CallRecord] = deque(maxlen=window)
+        self.persist = persist
+        self.flush_size = flush_size
+        self.total_calls = 0
+        self.total_cost = 0.0
+        self._pending: list[CallRecord] = []
+
+    def record(self, rec: CallRecord) -> None:
+        """Add ``rec`` to the window and queue it for the DB."""
+        self.records.append(rec)
+        self.total_calls += 1
+        self.total_cost += rec.cost
+        if self.persist:
+            self._pending.append(rec)
+            if len(self._pending) >= self.flush_size:
+                self.flush()
+
+    def flush(self) -> int:
+        """Write queued records to ``llmcall``; returns how many were written."""
+        if not self._pending:
+            return 0
+        rows = [asdict(r) for r in self._pending]
+        try:
+            with Session(engine) as session:
+                session.execute(insert(LLMCall), rows)
+                session.commit()
+        except SQLAlchemyError as exc:
+            logger.warning(f"Dropping {len(rows)} LLM telemetry rows: {exc!r}")
+        self._pending.clear()
+        return len(rows)
+
+    def summary(self, slowest: int = 10) -> dict[str, Any]:
+        """Aggregate the window per ``(pipeline, model)``, plus the slowest upstream calls."""
+        groups: dict[tuple[str, str], list[CallRecord]] = {}
+        for rec in self.records:
+            groups.setdefault((rec.pipeline, rec.model), []).append(rec)
+        out = []
+        for (pipeline, model), recs in sorted(groups.items()):
+            upstream = [r for r in recs if r.status not in FREE_STATUSES]
+            latencies = sorted(r.latency_ms for r in upstream if r.status == "upstream")
+            completion = [r.completion_tokens for r in upstream if r.completion_tokens is not None]
+            statuses: dict[str, int] = {}
+            for r in recs:
+                statuses[r.status] = statuses.get(r.status, 0) + 1
+            out.append(
+                {
+                    "pipeline": pipeline,
+                    "model": model,
+                    "calls": len(recs),
+                    "statuses": statuses,
+                    "prompt_tokens": sum(r.prompt_tokens or 0 for r in upstream),
+                    "completion_tokens": sum(completion),
+                    "max_completion_tokens": max(completion, default=0),
+                    "max_tokens": max((r.max_tokens or 0 for r in upstream), default=0),
+                    "cost_usd": round(sum(r.cost for r in upstream), 6),
+                    "latency_ms": {
+                        "p50": round(_percentile(latencies, 50), 1),
+                        "p95": round(_percentile(latencies, 95), 1),
+                        "p99": round(_percentile(latencies, 99), 1),
+                    },
+                }
+            )
+        slow = sorted((r for r in self.records if r.status == "upstream"), key=lambda r: -r.latency_ms)
+        return {
+            "window": len(self.records),
+            "total_calls": self.total_calls,
+            "total_cost_usd": round(self.total_cost, 6),
+            "groups": out,
+            "slowest": [
+                {**asdict(r), "created_at": r.created_at.isoformat()} for r in slow[:slowest]
+            ],
+        }
+
+
+calls = Telemetry()
+
+
+__all__: list[str] = ["CallRecord", "PRICES_PER_1K", "Telemetry", "calls", "cost"]
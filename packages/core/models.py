@@ -7,6 +7,7 @@ from __future__ import annotations
 
 import datetime as _dt
 
+from sqlalchemy import BigInteger, Index, text
 from sqlmodel import SQLModel, Field, Relationship
 
 from typing import List
@@ -30,32 +31,110 @@ class Feed(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     handle: str = Field(unique=True, index=True, nullable=False)
     last_post_id: str | None = None  # last ingested tweet id for incremental fetch
+    user_id: str | None = None  # resolved Twitter user id, saves a lookup per poll
+    user_id_resolved_at: _dt.datetime | None = None
+    backfill_token: str | None = None  # pagination token to resume an interrupted backfill
+    backfilled_at: _dt.datetime | None = None
 
 
 class Post(SQLModel, table=True):
     """Tweet that was summarised."""
 
+    # partial index: finding unprocessed posts stays a short range scan however many are done
+    __table_args__ = (
+        Index(
+            "ix_post_unprocessed",
+            "id",
+            postgresql_where=text("processing_state = 'pending'"),
+            sqlite_where=text("processing_state = 'pending'"),
+        ),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     feed_id: int = Field(foreign_key="feed.id", nullable=False)
     tweet_id: str = Field(index=True, unique=True, nullable=False)
     text: str
     created_at: _dt.datetime = Field(default_factory=_dt.datetime.utcnow)
+    fingerprint: int | None = Field(default=None, sa_type=BigInteger)  # signed 64-bit SimHash
+    duplicate_of_id: int | None = Field(default=None, foreign_key="post.id")  # near-duplicate whose cards we reuse
+    processing_state: str = Field(default="pending", nullable=False)  # pending | queued | done | failed | duplicate
+    processed_at: _dt.datetime | None = None
 
 
 class Flashcard(SQLModel, table=True):
-    """Generated flashcard."""
+    """Generated flashcard, shared by every user who studies it."""
 
     id: int | None = Field(default=None, primary_key=True)
-    owner_id: int = Field(foreign_key="user.id", nullable=False)
     post_id: int = Field(foreign_key="post.id", nullable=False)
     question: str
     answer: str
+
+
+class CardSchedule(SQLModel, table=True):
+    """One user's SM-2 state for a :class:`Flashcard`."""
+
+    # serves the due-deck query and its (next_review, flashcard_id) keyset pagination
+    __table_args__ = (
+        Index("ix_cardschedule_user_id_next_review", "user_id", "next_review", "flashcard_id"),
+    )
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    flashcard_id: int = Field(foreign_key="flashcard.id", primary_key=True)
     ease_factor: float = 2.5  # SM-2 default
     interval: int = 1  # days until next review
     repetitions: int = 0
     next_review: _dt.date = Field(default_factory=_dt.date.today)
 
 
+class ReviewLog(SQLModel, table=True):
+    """Append-only record of one review and the schedule it produced."""
+
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", nullable=False)
+    flashcard_id: int = Field(foreign_key="flashcard.id", nullable=False)
+    quality: int  # 0-5 recall grade
+    reviewed_at: _dt.datetime = Field(default_factory=_dt.datetime.utcnow)
+    ease_factor: float
+    interval: int
+    repetitions: int
+    next_review: _dt.date
+
+
+class PostJob(SQLModel, table=True):
+    """Queued LLM work for a post, leased by the flashcard consumers."""
+
+    id: int | None = Field(default=None, primary_key=True)
+    post_id: int = Field(foreign_key="post.id", unique=True, index=True, nullable=False)
+    status: str = Field(default="pending", index=True)  # pending | leased | done | failed
+    attempts: int = 0
+    available_at: _dt.datetime = Field(default_factory=_dt.datetime.utcnow)  # retry backoff
+    lease_until: _dt.datetime | None = None
+    last_error: str | None = None
+    created_at: _dt.datetime = Field(default_factory=_dt.datetime.utcnow)
+
+
+class RssCache(SQLModel, table=True):
+    """HTTP validators of the last fetch of an RSS feed URL."""
+
+    url: str = Field(primary_key=True)
+    etag: str | None = None
+    last_modified: str | None = None
+    content_hash: str | None = None  # sha256 of the last body we parsed
+    checked_at: _dt.datetime = Field(default_factory=_dt.datetime.utcnow)
+
+
+class LLMCall(SQLModel, table=True):
+    """One chat completion as seen by the worker, for latency and cost analysis."""
+
+    id: int | None = Field(default=None, primary_key=True)
+    created_at: _dt.datetime = Field(default_factory=_dt.datetime.utcnow, index=True)
+    pipeline: str = Field(index=True)  # calling route or pipeline
+    model: str
+    status: str  # upstream | memory | disk | coalesced | error
+    latency_ms: float
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    max_tokens: int | None = None
 
 
 __all__: list[str] = [
@@ -63,4 +142,9 @@ __all__: list[str] = [
     "Feed",
     "Post",
     "Flashcard",
+    "CardSchedule",
+    "ReviewLog",
+    "PostJob",
+    "RssCache",
+    "LLMCall",
 ]
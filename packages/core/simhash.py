@@ -0,0 +1,100 @@
+"""64-bit SimHash fingerprints and a banded index for near-duplicate lookup."""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Generic, Hashable, Iterable, TypeVar
+
+BITS = 64
+_MASK = (1 << BITS) - 1
+_TOKEN = re.compile(r"[a-z0-9]+")
+_URL = re.compile(r"https?://\S+")
+
+K = TypeVar("K", bound=Hashable)
+
+
+def features(text: str) -> list[str]:
+    """Return word unigrams and bigrams of ``text`` with URLs stripped."""
+    words = _TOKEN.findall(_URL.sub(" ", text.lower()))
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """Return the unsigned 64-bit SimHash of ``text``."""
+    weights = [0] * BITS
+    for feature in features(text):
+        h = _hash(feature)
+        for bit in range(BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two fingerprints."""
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def to_signed(value: int) -> int:
+    """Map an unsigned fingerprint onto a signed BIGINT column."""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    """Inverse of :func:`to_signed`."""
+    return value & _MASK
+
+
+class SimHashIndex(Generic[K]):
+    """Find fingerprints within ``max_distance`` bits without a full scan.
+
+    The 64 bits are split into ``max_distance + 1`` bands; by the pigeonhole
+    principle two fingerprints that differ in at most ``max_distance`` bits
+    agree exactly on at least one band, so only those buckets are checked.
+    """
+
+    def __init__(self, max_distance: int = 3) -> None:
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width, extra = divmod(BITS, bands)
+        self._bands: list[tuple[int, int]] = []
+        shift = 0
+        for i in range(bands):
+            w = width + (1 if i < extra else 0)
+            self._bands.append((shift, (1 << w) - 1))
+            shift += w
+        self._buckets: list[dict[int, list[tuple[int, K]]]] = [{} for _ in range(bands)]
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, fingerprint: int, key: K) -> None:
+        """Index ``fingerprint`` under ``key``."""
+        fingerprint = to_unsigned(fingerprint)
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault(fingerprint >> shift & mask, []).append((fingerprint, key))
+        self._size += 1
+
+    def update(self, items: Iterable[tuple[int, K]]) -> None:
+        """Index every ``(fingerprint, key)`` pair."""
+        for fingerprint, key in items:
+            self.add(fingerprint, key)
+
+    def query(self, fingerprint: int) -> K | None:
+        """Return the key of the closest indexed fingerprint within range."""
+        fingerprint = to_unsigned(fingerprint)
+        best: tuple[int, K] | None = None
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for other, key in buckets.get(fingerprint >> shift & mask, ()):
+                distance = hamming(fingerprint, other)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, key)
+        return best[1] if best else None
+
+
+__all__: list[str] = ["simhash", "hamming", "to_signed", "to_unsigned", "features", "SimHashIndex"]
@@ -1,6 +1,6 @@
 """DB helper exports."""
 
-from .session import engine, async_session_maker, init_db, get_session
+from .session import engine, async_session_maker, async_url, sync_url, init_db, get_session
 
-__all__ = ["engine", "async_session_maker", "init_db", "get_session"]
+__all__ = ["engine", "async_session_maker", "async_url", "sync_url", "init_db", "get_session"]
 
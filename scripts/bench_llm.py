@@ -0,0 +1,165 @@
+"""Load-test the worker's LLM paths against the local fake OpenAI server.
+
+Starts :mod:`apps.worker.fake_openai` on a free port, points the worker's
+OpenAI clients at it and reports throughput and p50/p95/p99 latency for
+``/summarise``, ``/flashcards`` and the job-queue pipeline (summarise →
+flashcards per queued post)::
+
+    python scripts/bench_llm.py --requests 200 --concurrency 20 --latency-ms 800 --error-rate 0.02
+
+Uses a throwaway SQLite database unless ``DATABASE_URL`` is set. Every
+request carries unique text so the completion cache never answers it.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import anyio
+import httpx
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def report(name: str, latencies: list[float], errors: int, elapsed: float) -> None:
+    done = len(latencies)
+    print(
+        f"{name:<12} {done:>5} ok {errors:>4} err  {done / elapsed:7.1f} req/s  "
+        f"p50 {percentile(latencies, 50) * 1000:7.0f}ms  p95 {percentile(latencies, 95) * 1000:7.0f}ms  "
+        f"p99 {percentile(latencies, 99) * 1000:7.0f}ms"
+    )
+
+
+def start_fake_server(fake) -> str:
+    """Serve the fake API from a background thread and return its base URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def bench_route(app, path: str, requests: int, concurrency: int) -> None:
+    latencies: list[float] = []
+    errors = 0
+    limiter = anyio.CapacityLimiter(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with limiter:
+                started = time.perf_counter()
+                resp = await client.post(path, json={"text": f"Benchmark post {i} {time.time_ns()}"})
+                if resp.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        async with anyio.create_task_group() as tg:
+            for i in range(requests):
+                tg.start_soon(one, i)
+        report(path, latencies, errors, time.perf_counter() - started)
+
+
+async def bench_pipeline(posts: int, concurrency: int) -> None:
+    from sqlmodel import Session
+
+    from apps.worker import engine
+    from apps.worker.pipelines import jobs
+    from packages.core.models import Feed, Post
+
+    run_id = time.time_ns()
+    with Session(engine) as session:
+        feed = Feed(handle=f"bench-{run_id}")
+        session.add(feed)
+        session.flush()
+        rows = [Post(feed_id=feed.id, tweet_id=f"bench-{run_id}-{i}", text=f"Bench post {i} {run_id}") for i in range(posts)]
+        session.add_all(rows)
+        session.flush()
+        jobs.enqueue_posts(session, [p.id for p in rows])
+        session.commit()
+
+    latencies: list[float] = []
+    errors = 0
+    process = jobs.process_job
+
+    async def timed(job, text):
+        nonlocal errors
+        started = time.perf_counter()
+        ok = await process(job, text)
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors += 1
+        return ok
+
+    jobs.process_job = timed
+    try:
+        started = time.perf_counter()
+        await jobs.run_consumers(concurrency, drain=True, idle_seconds=0.1)
+        report("pipeline", latencies, errors, time.perf_counter() - started)
+    finally:
+        jobs.process_job = process
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="requests per route / posts in the pipeline")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # the worker package builds its engine and clients on import, so configure first
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    from apps.worker.fake_openai import FakeSettings, create_app
+
+    settings = FakeSettings(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=0.2,
+        seed=args.seed,
+    )
+    fake = create_app(settings)
+    os.environ["OPENAI_BASE_URL"] = start_fake_server(fake)
+    from apps.worker.main import app
+
+    async def run() -> None:
+        await bench_route(app, "/summarise", args.requests, args.concurrency)
+        await bench_route(app, "/flashcards", args.requests, args.concurrency)
+        await bench_pipeline(args.requests, args.concurrency)
+
+    anyio.run(run)
+    print(f"fake server answered {fake.state.requests} upstream calls (retries included)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """Ensure project root is on sys.path during pytest collection."""
 import sys
+import tempfile
 from pathlib import Path
 import os
 
@@ -7,17 +8,15 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-# use in-memory database for tests
-os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
-import pytest
+# a throwaway SQLite file: the sync (pysqlite) and async (aiosqlite) engines
+# must see the same database, which an in-memory one cannot provide
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
 from alembic import command
 from alembic.config import Config
 
 
-@pytest.fixture(scope="session", autouse=True)
-def apply_migrations() -> None:
-    """Apply Alembic migrations before tests run."""
+def pytest_sessionstart(session) -> None:
+    """Apply Alembic migrations before test modules import the app."""
 
     cfg = Config(str(ROOT / "alembic.ini"))
     command.upgrade(cfg, "head")
-    yield
@@ -0,0 +1,69 @@
+import pytest
+
+from apps.worker import cardparse
+from apps.worker.cardparse import CardParseError, CardStreamParser, parse_cards, repair_json
+
+
+def feed_all(chunks):
+    parser = CardStreamParser()
+    return [parser.feed(c) for c in chunks]
+
+
+def test_cards_emitted_when_object_closes():
+    out = feed_all(['[{"question":"Q1","ans', 'wer":"A1"}', ',{"question":"Q2",', '"answer":"A2"}]'])
+    assert out == [[], [{"question": "Q1", "answer": "A1"}], [], [{"question": "Q2", "answer": "A2"}]]
+
+
+def test_wrapped_array_and_braces_inside_strings():
+    text = '{"flashcards": [{"question": "What is {x}?", "answer": "a \\"}\\" brace"}]}'
+    out = [card for batch in feed_all(list(text)) for card in batch]
+    assert out == [{"question": "What is {x}?", "answer": 'a "}" brace'}]
+
+
+def test_nested_objects_only_emit_outer_card():
+    out = feed_all(['[{"question":"Q","answer":"A","meta":{"k":[{"z":1}]}}]'])
+    assert out == [[{"question": "Q", "answer": "A", "meta": {"k": [{"z": 1}]}}]]
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(cardparse, "stats", cardparse.ParseStats())
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        '[{"question": "Q", "answer": "A"}]',
+        '{"flashcards": [{"question": "Q", "answer": "A"}]}',
+        '{"result": [{"question": "Q", "answer": "A"}]}',
+        '{"question": "Q", "answer": "A"}',
+        '```json\n[{"question": "Q", "answer": "A"}]\n```',
+        'Here you go: [{"question": "Q", "answer": "A"}]',
+    ],
+)
+def test_parse_cards_shapes(reply):
+    assert parse_cards(reply) == [{"question": "Q", "answer": "A"}]
+
+
+def test_truncated_reply_keeps_complete_cards():
+    reply = '{"flashcards": [{"question": "Q1", "answer": "A1"}, {"question": "Q2", "answer": "A'
+    assert parse_cards(reply) == [{"question": "Q1", "answer": "A1"}]
+    assert cardparse.stats.repaired == 1
+
+
+def test_invalid_cards_dropped_individually():
+    reply = '[{"question": "Q", "answer": "A"}, {"question": "no answer"}, "junk"]'
+    assert parse_cards(reply) == [{"question": "Q", "answer": "A"}]
+    assert cardparse.stats.dropped == 2
+
+
+def test_unparseable_reply_counted():
+    with pytest.raises(CardParseError):
+        parse_cards("I cannot help with that.")
+    assert parse_cards("[]") == []
+    assert (cardparse.stats.replies, cardparse.stats.failures) == (2, 1)
+
+
+def test_repair_closes_nested_containers():
+    assert repair_json('{"1": [{"question": "Q", "answer": "A"}], "2": [{"quest') == {
+        "1": [{"question": "Q", "answer": "A"}]
+    }
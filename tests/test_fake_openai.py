@@ -0,0 +1,59 @@
+import json
+
+import anyio
+import httpx
+import pytest
+from openai import AsyncOpenAI, InternalServerError, RateLimitError
+
+from apps.worker.fake_openai import FakeSettings, create_app
+
+
+def make_openai(**settings) -> tuple[AsyncOpenAI, object]:
+    app = create_app(FakeSettings(latency_ms=1, latency_sigma=0, seed=1, **settings))
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    return AsyncOpenAI(api_key="test", base_url="http://fake/v1", http_client=http, max_retries=0), app
+
+
+def test_flashcard_reply_parses_as_cards():
+    async def run():
+        client, app = make_openai()
+        chat = await client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": "Convert the following text to <=5 study flashcards"}],
+        )
+        cards = json.loads(chat.choices[0].message.content)["flashcards"]
+        assert cards and set(cards[0]) == {"question", "answer"}
+        assert chat.usage.total_tokens > 0
+        assert app.state.requests == 1
+
+    anyio.run(run)
+
+
+def test_streaming_reassembles_reply():
+    async def run():
+        client, _ = make_openai()
+        stream = await client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": "Summarise:\nthe quick brown fox"}],
+            stream=True,
+        )
+        pieces = [chunk.choices[0].delta.content or "" async for chunk in stream]
+        assert len(pieces) > 2
+        assert "".join(pieces) == "Summarise: the quick brown fox"
+
+    anyio.run(run)
+
+
+@pytest.mark.parametrize(
+    ("settings", "error"),
+    [({"rate_limit_rate": 1.0}, RateLimitError), ({"error_rate": 1.0}, InternalServerError)],
+)
+def test_injected_failures(settings, error):
+    async def run():
+        client, _ = make_openai(**settings)
+        with pytest.raises(error):
+            await client.chat.completions.create(
+                model="gpt-3.5-turbo", messages=[{"role": "user", "content": "hi"}]
+            )
+
+    anyio.run(run)
@@ -1,4 +1,5 @@
 import asyncio
+import httpx
 import pytest
 from apps.worker import feeds
 
@@ -19,11 +20,159 @@ def test_parse_rss():
 
 
 def test_ingest_twitter(monkeypatch):
-    async def fake_fetch(url: str) -> str:
-        return SAMPLE_RSS
+    async def fake_stream(url: str, last_seen=None):
+        for post in feeds.parse_rss(SAMPLE_RSS):
+            yield post
 
-    monkeypatch.setattr(feeds, "fetch_rss", fake_fetch)
+    monkeypatch.setattr(feeds, "stream_rss", fake_stream)
     posts = asyncio.run(feeds.ingest_twitter("user"))
     assert len(posts) == 2
     assert posts[0]["title"] == "First post"
 
+
+
+@pytest.fixture
+def rss_db(monkeypatch):
+    from sqlmodel import create_engine
+    from apps import worker
+
+    test_engine = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(worker, "engine", test_engine)
+    monkeypatch.setattr(feeds, "engine", test_engine)
+    monkeypatch.setattr(feeds, "_validators", {})
+    monkeypatch.setattr(feeds, "_pending", {})
+    worker.init_db()
+    yield
+
+
+def test_fetch_rss_conditional_get(rss_db):
+    seen_headers = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_headers.append(dict(request.headers))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text=SAMPLE_RSS, headers={"ETag": '"v1"'})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            first = await feeds.fetch_rss("https://example.com/rss", client)
+            feeds.commit_validators("https://example.com/rss")
+            feeds._validators.clear()  # validators survive a restart via the DB
+            second = await feeds.fetch_rss("https://example.com/rss", client)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == SAMPLE_RSS
+    assert second is None
+    assert seen_headers[1]["if-none-match"] == '"v1"'
+
+
+def test_fetch_rss_skips_identical_body(rss_db):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=SAMPLE_RSS)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            first = await feeds.fetch_rss("https://example.com/rss", client)
+            feeds.commit_validators("https://example.com/rss")
+            return [first, await feeds.fetch_rss("https://example.com/rss", client)]
+
+    assert asyncio.run(run()) == [SAMPLE_RSS, None]
+
+
+def test_validators_wait_for_a_successful_store(rss_db, monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, text=SAMPLE_RSS, headers={"ETag": '"v1"'})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        feeds.httpx, "AsyncClient", lambda: real_client(transport=httpx.MockTransport(handler))
+    )
+    stored = []
+
+    async def broken_store(posts):
+        raise RuntimeError("db down")
+
+    async def store(posts):
+        stored.extend(posts)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await feeds.ingest_twitter("user", store=broken_store)
+        # the failed store left the feed unseen, so the items come back
+        await feeds.ingest_twitter("user", store=store)
+        assert len(stored) == 2
+        await feeds.ingest_twitter("user", store=store)
+
+    asyncio.run(run())
+    assert len(stored) == 2
+
+
+def test_iter_rss_items_stops_at_last_seen():
+    body = SAMPLE_RSS.replace(
+        "</channel>", "<item><title>Old</title><link>https://example.com/0</link></item></channel>"
+    ).encode()
+    chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+
+    posts = list(feeds.iter_rss_items(chunks, last_seen="https://example.com/2"))
+    assert posts == [{"title": "First post", "link": "https://example.com/1"}]
+    assert list(feeds.iter_rss_items(chunks)) == feeds.parse_rss(body.decode())
+
+
+def test_stream_rss_closes_early(rss_db):
+    items = "".join(
+        f"<item><title>Post {i}</title><link>https://example.com/{i}</link><guid>g{i}</guid></item>"
+        for i in range(100, 0, -1)
+    )
+    body = f"<rss><channel>{items}</channel></rss>".encode()
+    chunks = [body[i : i + 64] for i in range(0, len(body), 64)]
+    sent = 0
+
+    async def content():
+        nonlocal sent
+        for chunk in chunks:
+            sent += 1
+            yield chunk
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=content())
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return [p async for p in feeds.stream_rss("https://example.com/rss", "g97", client)]
+
+    posts = asyncio.run(run())
+    assert [p["title"] for p in posts] == ["Post 100", "Post 99", "Post 98"]
+    assert sent < len(chunks) // 2
+
+
+def test_ingest_streams_into_store_in_chunks(rss_db, monkeypatch):
+    items = "".join(f"<item><title>Post {i}</title><link>https://example.com/{i}</link></item>" for i in range(5))
+    body = f"<rss><channel>{items}</channel></rss>"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=body)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        feeds.httpx, "AsyncClient", lambda: real_client(transport=httpx.MockTransport(handler))
+    )
+    monkeypatch.setattr(feeds, "RSS_STORE_CHUNK", 2)
+    chunks = []
+
+    async def store(posts):
+        chunks.append([p["title"] for p in posts])
+
+    async def run():
+        await feeds.ingest_youtube("channel", store=store)
+        # no validators, but the same body hashes the same: nothing left to store
+        await feeds.ingest_youtube("channel", store=store)
+        return await feeds.ingest_youtube("channel")
+
+    assert asyncio.run(run()) == []
+    # full chunks of the repeated body go out before its hash is known, the rest is dropped
+    first = [["Post 0", "Post 1"], ["Post 2", "Post 3"], ["Post 4"]]
+    assert chunks == first + first[:2]
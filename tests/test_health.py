@@ -1,8 +1,6 @@
 import httpx
-import os
 import anyio
 
-os.environ["DATABASE_URL"] = "sqlite://"
 from apps.worker.main import app
 
 
@@ -11,6 +9,25 @@ def test_health_check():
         async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
             response = await client.get("/health")
             assert response.status_code == 200
-            assert response.json() == {"status": "ok"}
+            body = response.json()
+            assert body["status"] == "ok"
+            assert body["openai"]["circuit"] == "closed"
 
     anyio.run(run)
+
+
+def test_startup_creates_demo_rows():
+    from sqlmodel import Session
+
+    from apps.worker import engine
+    from apps.worker.bulk import DEMO_USER_ID, MANUAL_FEED_ID
+    from packages.core.models import Feed, User
+
+    async def run() -> None:
+        async with app.router.lifespan_context(app):
+            pass
+
+    anyio.run(run)
+    with Session(engine) as ses:
+        assert ses.get(User, DEMO_USER_ID) is not None
+        assert ses.get(Feed, MANUAL_FEED_ID).handle == "manual"
@@ -0,0 +1,148 @@
+import datetime as dt
+
+import anyio
+import pytest
+from sqlmodel import Session, create_engine, select
+
+from apps import worker
+from apps.worker.pipelines import jobs
+from apps.worker.main import SummaryOut, FlashcardsOut, Flashcard as CardSchema
+from packages.core.models import Feed, Flashcard, Post, PostJob
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    test_engine = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(worker, "engine", test_engine)
+    monkeypatch.setattr(jobs, "engine", test_engine)
+    worker.init_db()
+    with Session(test_engine) as ses:
+        ses.add(Feed(id=1, handle="h"))
+        ses.add_all([Post(id=i, feed_id=1, tweet_id=str(i), text=f"post {i}") for i in (1, 2, 3)])
+        jobs.enqueue_posts(ses, [1, 2, 3])
+        ses.commit()
+    yield test_engine
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    async def fake_summarise(payload, pipeline):
+        calls.append(payload.text)
+        if "2" in payload.text:
+            raise RuntimeError("upstream down")
+        return SummaryOut(summary=payload.text)
+
+    async def fake_flashcards(payload, pipeline):
+        return FlashcardsOut(flashcards=[CardSchema(question=payload.text, answer="a")])
+
+    monkeypatch.setattr(jobs, "summarise", fake_summarise)
+    monkeypatch.setattr(jobs, "generate_cards", fake_flashcards)
+    return calls
+
+
+def test_consumers_process_queue_and_retry_failures(setup_db, llm):
+    done = anyio.run(lambda: jobs.run_consumers(concurrency=2, drain=True))
+
+    assert done == 2
+    assert sorted(llm) == ["post 1", "post 2", "post 3"]
+    with Session(setup_db) as ses:
+        by_post = {j.post_id: j for j in ses.exec(select(PostJob)).all()}
+        assert {p: j.status for p, j in by_post.items()} == {1: "done", 2: "pending", 3: "done"}
+        assert by_post[2].attempts == 1 and "upstream down" in by_post[2].last_error
+        assert by_post[2].available_at > dt.datetime.utcnow()
+        assert sorted(c.question for c in ses.exec(select(Flashcard)).all()) == ["post 1", "post 3"]
+        states = {p.id: p.processing_state for p in ses.exec(select(Post)).all()}
+        assert states == {1: "done", 2: "queued", 3: "done"}
+
+
+def test_job_gives_up_after_max_attempts(setup_db, llm, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(jobs, "RETRY_BASE_SECONDS", 0)
+    anyio.run(lambda: jobs.run_consumers(drain=True))
+
+    with Session(setup_db) as ses:
+        job = ses.exec(select(PostJob).where(PostJob.post_id == 2)).one()
+        post = ses.get(Post, 2)
+    assert job.status == "failed" and job.attempts == 2
+    assert post.processing_state == "failed" and post.processed_at is not None
+
+
+def test_consumer_survives_a_database_error(setup_db, llm, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    real_claim = jobs.claim_jobs
+
+    def flaky_claim(limit):
+        monkeypatch.setattr(jobs, "claim_jobs", real_claim)
+        raise OperationalError("claim", {}, Exception("connection dropped"))
+
+    monkeypatch.setattr(jobs, "claim_jobs", flaky_claim)
+    done = anyio.run(lambda: jobs.run_consumers(concurrency=1, drain=True, idle_seconds=0))
+
+    assert done == 2
+    with Session(setup_db) as ses:
+        assert {j.post_id: j.status for j in ses.exec(select(PostJob)).all()} == {1: "done", 2: "pending", 3: "done"}
+
+
+def test_expired_lease_is_reclaimed(setup_db):
+    [(job, text)] = jobs.claim_jobs(1, lease_seconds=-1)
+    assert text == "post 1"
+
+    reclaimed = jobs.claim_jobs(3)
+    assert [j.post_id for j, _ in reclaimed] == [1, 2, 3]
+    assert reclaimed[0][0].attempts == 2
+    assert jobs.claim_jobs(3) == []
+
+
+def test_stale_consumer_cannot_finish_or_fail_a_reclaimed_job(setup_db):
+    [(stale, _)] = jobs.claim_jobs(1, lease_seconds=-1)
+    [(fresh, _)] = jobs.claim_jobs(1)
+    assert fresh.id == stale.id and fresh.attempts == 2
+
+    assert jobs._finish(fresh, [CardSchema(question="fresh", answer="a")])
+    assert not jobs._finish(stale, [CardSchema(question="stale", answer="a")])
+    jobs._fail(stale, "late failure")
+
+    with Session(setup_db) as ses:
+        job = ses.get(PostJob, fresh.id)
+        assert job.status == "done" and job.last_error is None
+        assert [c.question for c in ses.exec(select(Flashcard)).all()] == ["fresh"]
+
+
+def test_job_calls_are_labelled_in_telemetry(setup_db, monkeypatch):
+    import types
+
+    from apps.worker import llm as llm_module, main, resilience, telemetry
+
+    async def fake_create(**kwargs):
+        content = '{"flashcards": [{"question": "Q", "answer": "A"}]}'
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(llm_module, "cache", llm_module.LLMCache())
+    monkeypatch.setattr(resilience, "guard", resilience.UpstreamGuard())
+    monkeypatch.setattr(telemetry, "calls", telemetry.Telemetry(persist=False))
+    [(job, text)] = jobs.claim_jobs(1)
+
+    assert anyio.run(jobs.process_job, job, text)
+    assert [r.pipeline for r in telemetry.calls.records] == ["jobs.summarise", "jobs.flashcards"]
+
+
+def test_queued_posts_are_left_to_the_consumers(setup_db, monkeypatch):
+    from apps.worker.pipelines import flashcards
+
+    monkeypatch.setattr(flashcards, "engine", setup_db)
+    with Session(setup_db) as ses:
+        ses.add(Post(id=4, feed_id=1, tweet_id="4", text="post 4"))
+        ses.commit()
+    seen = []
+
+    async def fake_cards(text, retries):
+        seen.append(text)
+        return []
+
+    monkeypatch.setattr(flashcards, "_cards_for", fake_cards)
+    anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=10))
+    assert seen == ["post 4"]
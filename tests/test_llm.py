@@ -0,0 +1,136 @@
+import types
+
+import anyio
+
+from apps.worker import llm
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        content = f"reply {self.calls} to {kwargs['messages'][0]['content']}"
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+def test_key_depends_on_model_prompt_and_params():
+    messages = [{"role": "user", "content": "hi"}]
+    key = llm.LLMCache.key("m", messages, max_tokens=10)
+    assert key == llm.LLMCache.key("m", [{"content": "hi", "role": "user"}], max_tokens=10)
+    assert key != llm.LLMCache.key("m", messages, max_tokens=11)
+    assert key != llm.LLMCache.key("other", messages, max_tokens=10)
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = llm.LLMCache(max_entries=2, ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr(llm.time, "time", lambda: now[0])
+
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"  # a is now most recent
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.stats.memory_hits == 3 and cache.stats.misses == 2 and cache.stats.evictions == 1
+
+
+def test_disk_tier_survives_restart_and_is_bounded(tmp_path):
+    cache = llm.LLMCache(directory=tmp_path, max_disk_entries=10)
+    for i in range(12):
+        cache.set(f"{i:064x}", str(i))
+
+    restarted = llm.LLMCache(directory=tmp_path, max_disk_entries=10)
+    assert restarted.get(f"{11:064x}") == "11"
+    assert restarted.stats.disk_hits == 1
+    assert len(list(tmp_path.glob("*/*.json"))) <= 10
+
+
+def test_forget_drops_both_tiers(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, "cache", llm.LLMCache(directory=tmp_path))
+    messages = [{"role": "user", "content": "bad reply"}]
+    key = llm.cache.key("m", messages, max_tokens=5)
+    llm.cache.set(key, "not json")
+
+    llm.forget("m", messages, max_tokens=5)
+    assert llm.cache.get(key) is None
+    assert list(tmp_path.glob("*/*.json")) == []
+
+
+def test_complete_serves_repeats_from_cache(monkeypatch):
+    monkeypatch.setattr(llm, "cache", llm.LLMCache())
+    client = FakeClient()
+    messages = [{"role": "user", "content": "Summarise: x"}]
+
+    async def run():
+        first = await llm.complete(client, "gpt-3.5-turbo", messages, max_tokens=128)
+        again = await llm.complete(client, "gpt-3.5-turbo", messages, max_tokens=128)
+        other = await llm.complete(client, "gpt-3.5-turbo", messages, max_tokens=64)
+        return first, again, other
+
+    first, again, other = anyio.run(run)
+    assert first == again != other
+    assert client.calls == 2
+    assert llm.cache.stats.hits == 1 and llm.cache.stats.misses == 2
+
+
+def test_concurrent_identical_requests_share_one_call(monkeypatch):
+    monkeypatch.setattr(llm, "cache", llm.LLMCache())
+    client = FakeClient()
+    slow = client.create
+
+    async def slow_create(**kwargs):
+        await anyio.sleep(0.05)
+        return await slow(**kwargs)
+
+    client.chat.completions.create = slow_create
+    results = []
+
+    async def call(text):
+        results.append(await llm.complete(client, "m", [{"role": "user", "content": text}]))
+
+    async def run():
+        async with anyio.create_task_group() as tg:
+            for text in ["same"] * 5 + ["other"]:
+                tg.start_soon(call, text)
+
+    anyio.run(run)
+    assert client.calls == 2
+    same = [r for r in results if r.endswith("to same")]
+    assert len(same) == 5 and len(set(same)) == 1
+    assert llm.cache.stats.coalesced == 4
+    assert llm._in_flight == {}
+
+
+def test_coalesced_callers_share_the_error(monkeypatch):
+    monkeypatch.setattr(llm, "cache", llm.LLMCache())
+    calls = 0
+
+    async def failing(**kwargs):
+        nonlocal calls
+        calls += 1
+        await anyio.sleep(0.02)
+        raise RuntimeError("upstream")
+
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=failing)))
+    errors = []
+
+    async def call():
+        try:
+            await llm.complete(client, "m", [{"role": "user", "content": "x"}])
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    async def run():
+        async with anyio.create_task_group() as tg:
+            for _ in range(3):
+                tg.start_soon(call)
+
+    anyio.run(run)
+    assert calls == 1 and len(errors) == 3
@@ -1,7 +1,7 @@
 import pytest
 from sqlmodel import select
 
-from packages.core.models import User, Feed, Post, Flashcard
+from packages.core.models import CardSchedule, User, Feed, Post, Flashcard
 from packages.db import async_session_maker, init_db
 
 
@@ -24,12 +24,27 @@ async def test_model_crud_round_trip() -> None:
         await session.commit()
         await session.refresh(post)
 
-        card = Flashcard(owner_id=user.id, post_id=post.id, question="Q", answer="A")
+        card = Flashcard(post_id=post.id, question="Q", answer="A")
         session.add(card)
         await session.commit()
+        await session.refresh(card)
+
+        session.add(CardSchedule(user_id=user.id, flashcard_id=card.id))
+        await session.commit()
 
         result = await session.exec(select(Flashcard).where(Flashcard.id == card.id))
         fetched = result.one()
         assert fetched.question == "Q"
-        assert fetched.owner_id == user.id
+        sched = await session.get(CardSchedule, (user.id, card.id))
+        assert sched.repetitions == 0 and sched.ease_factor == 2.5
+
+
+
+def test_one_database_url_drives_both_engines() -> None:
+    from packages.db import async_url, sync_url
 
+    assert async_url("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+    assert sync_url("sqlite+aiosqlite:///x.db") == "sqlite+pysqlite:///x.db"
+    pg = "postgresql+psycopg2://u:secret@db:5432/vibe"
+    assert async_url(pg) == "postgresql+asyncpg://u:secret@db:5432/vibe"
+    assert sync_url(async_url(pg)) == pg
@@ -0,0 +1,191 @@
+import json
+import types
+
+import anyio
+import pytest
+from openai import APIError
+from sqlmodel import Session, create_engine, select
+
+from apps import worker
+from apps.worker import llm
+from apps.worker.pipelines import flashcards
+from packages.core.models import Feed, Flashcard, Post
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    test_engine = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(worker, "engine", test_engine)
+    monkeypatch.setattr(flashcards, "engine", test_engine)
+    monkeypatch.setattr(flashcards, "FLASHCARD_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(llm, "cache", llm.LLMCache())
+    worker.init_db()
+    with Session(test_engine) as ses:
+        ses.add(Feed(id=1, handle="h"))
+        ses.add_all(Post(id=i, feed_id=1, tweet_id=str(i), text=f"post {i}") for i in range(1, 7))
+        ses.commit()
+    yield test_engine
+
+
+def reply(content: str):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+def test_posts_converted_concurrently_with_per_post_commits(setup_db, monkeypatch):
+    in_flight = peak = 0
+    attempts: dict[str, int] = {}
+
+    async def fake_create(**kwargs):
+        nonlocal in_flight, peak
+        text = kwargs["messages"][0]["content"].rsplit("\n", 1)[-1]
+        attempts[text] = attempts.get(text, 0) + 1
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await anyio.sleep(0.01)
+        in_flight -= 1
+        if text == "post 2" and attempts[text] == 1:
+            raise APIError("flaky", request=None, body=None)
+        if text == "post 3":
+            return reply("not json")
+        if text == "post 4":
+            return reply("[]")
+        return reply(json.dumps([{"question": f"Q {text}", "answer": "A"}]))
+
+    monkeypatch.setattr(flashcards.client.chat.completions, "create", fake_create)
+    result = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=10, concurrency=3))
+
+    assert (result.created, result.failed, result.skipped) == (4, 1, 1)
+    assert len(result.latencies) == 6 and 0 < result.p50 <= result.p95 <= result.p99
+    assert peak == 3
+    assert attempts["post 2"] == 2
+    with Session(setup_db) as ses:
+        questions = sorted(c.question for c in ses.exec(select(Flashcard)).all())
+    assert questions == ["Q post 1", "Q post 2", "Q post 5", "Q post 6"]
+    with Session(setup_db) as ses:
+        states = {p.id: p.processing_state for p in ses.exec(select(Post)).all()}
+    # post 4 had no cards but is done all the same; post 3 was given up on
+    assert states == {1: "done", 2: "done", 3: "failed", 4: "done", 5: "done", 6: "done"}
+
+    again = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=10))
+    assert again.requests == 0
+
+
+def test_open_circuit_leaves_posts_pending(setup_db, monkeypatch):
+    async def rejected(*args, **kwargs):
+        raise flashcards.CircuitOpenError("open")
+
+    monkeypatch.setattr(flashcards, "complete", rejected)
+    result = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=2))
+
+    assert (result.failed, result.deferred) == (0, 2)
+    with Session(setup_db) as ses:
+        pending = ses.exec(select(Post.id).where(Post.processing_state == "pending")).all()
+    assert sorted(pending) == [1, 2, 3, 4, 5, 6]
+
+
+def test_database_error_leaves_only_that_post_pending(setup_db, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    async def fake_create(**kwargs):
+        text = kwargs["messages"][0]["content"].rsplit("\n", 1)[-1]
+        return reply(json.dumps([{"question": f"Q {text}", "answer": "A"}]))
+
+    real_store = flashcards._store
+
+    def flaky_store(post_id, raw_cards):
+        if post_id == 2:
+            raise OperationalError("store", {}, Exception("database is locked"))
+        return real_store(post_id, raw_cards)
+
+    monkeypatch.setattr(flashcards.client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(flashcards, "_store", flaky_store)
+    result = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=3))
+
+    assert (result.created, result.failed, result.deferred) == (2, 0, 1)
+    with Session(setup_db) as ses:
+        states = {p.id: p.processing_state for p in ses.exec(select(Post).where(Post.id <= 3)).all()}
+    assert states == {1: "done", 2: "pending", 3: "done"}
+
+
+def test_gives_up_after_retries(monkeypatch):
+    calls = 0
+
+    async def always_fail(**kwargs):
+        nonlocal calls
+        calls += 1
+        raise APIError("down", request=None, body=None)
+
+    monkeypatch.setattr(flashcards.client.chat.completions, "create", always_fail)
+    result = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=1, retries=2))
+
+    assert result.failed == 1 and result.created == 0
+    assert calls == 3
+
+
+def test_percentiles():
+    result = flashcards.BatchResult(latencies=[float(i) for i in range(1, 101)])
+    assert (result.p50, result.p95, result.p99) == (50.0, 95.0, 99.0)
+    assert flashcards.BatchResult().p95 == 0.0
+
+
+def test_pack_respects_budget_and_size():
+    posts = [(i, "x" * 40) for i in range(7)]  # 18 tokens each
+    assert [len(g) for g in flashcards.pack(posts, budget=40, max_posts=10)] == [2, 2, 2, 1]
+    assert [len(g) for g in flashcards.pack(posts, budget=1000, max_posts=3)] == [3, 3, 1]
+    assert flashcards.pack([(1, "y" * 10_000)], budget=10) == [[(1, "y" * 10_000)]]
+
+
+def test_packed_mode_splits_reply_and_falls_back(setup_db, monkeypatch):
+    prompts = []
+
+    async def fake_create(**kwargs):
+        prompt = kwargs["messages"][0]["content"]
+        prompts.append(prompt)
+        if prompt.startswith("Convert each"):
+            return reply(
+                json.dumps(
+                    {
+                        "1": [{"question": "Q1", "answer": "A1"}],
+                        "2": [{"question": "Q2", "answer": "A2"}, {"question": "Q2b", "answer": "A2b"}],
+                        "3": [{"question": "only a question"}],  # malformed
+                        "4": [],
+                        "6": [{"question": "Q6", "answer": "A6"}],
+                    }
+                )
+            )
+        text = prompt.rsplit("\n", 1)[-1]
+        return reply(json.dumps([{"question": f"single {text}", "answer": "A"}]))
+
+    monkeypatch.setattr(flashcards.client.chat.completions, "create", fake_create)
+    result = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=10, packed=True))
+
+    # one packed request, then posts 3 (malformed) and 5 (missing) alone
+    assert result.requests == 3 and result.fallbacks == 2
+    assert (result.created, result.failed, result.skipped) == (6, 0, 1)
+    assert all(f"[{i}] post {i}" in prompts[0] for i in range(1, 7))
+    with Session(setup_db) as ses:
+        by_post = {}
+        for c in ses.exec(select(Flashcard)).all():
+            by_post.setdefault(c.post_id, []).append(c.question)
+    assert by_post == {1: ["Q1"], 2: ["Q2", "Q2b"], 3: ["single post 3"], 5: ["single post 5"], 6: ["Q6"]}
+
+
+def test_packed_fallbacks_run_concurrently(setup_db, monkeypatch):
+    in_flight = peak = 0
+
+    async def fake_create(**kwargs):
+        nonlocal in_flight, peak
+        prompt = kwargs["messages"][0]["content"]
+        if prompt.startswith("Convert each"):
+            return reply("{}")  # misses every post
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await anyio.sleep(0.01)
+        in_flight -= 1
+        return reply(json.dumps([{"question": "Q", "answer": "A"}]))
+
+    monkeypatch.setattr(flashcards.client.chat.completions, "create", fake_create)
+    result = anyio.run(lambda: flashcards.posts_to_flashcards(batch_size=4, concurrency=4, packed=True))
+
+    assert result.fallbacks == 4 and result.created == 4
+    assert peak == 4
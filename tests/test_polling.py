@@ -0,0 +1,65 @@
+import datetime as dt
+
+import anyio
+import pytest
+from sqlmodel import Session, create_engine
+
+from apps import worker
+from apps.worker import polling
+from packages.core.models import Feed, Post
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    test_engine = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(worker, "engine", test_engine)
+    monkeypatch.setattr(polling, "engine", test_engine)
+    worker.init_db()
+    now = dt.datetime.utcnow()
+    with Session(test_engine) as ses:
+        ses.add_all([Feed(id=1, handle="busy"), Feed(id=2, handle="quiet"), Feed(id=3, handle="silent")])
+        # busy posts every ten minutes for the last two weeks, quiet twice, silent long ago
+        ses.add_all(
+            Post(feed_id=1, tweet_id=f"b{i}", text="x", created_at=now - dt.timedelta(minutes=10 * i))
+            for i in range(14 * 24 * 6)
+        )
+        ses.add_all(
+            Post(feed_id=2, tweet_id=f"q{i}", text="x", created_at=now - dt.timedelta(days=3 * i + 1))
+            for i in range(2)
+        )
+        ses.add(Post(feed_id=3, tweet_id="s0", text="x", created_at=now - dt.timedelta(days=90)))
+        ses.commit()
+    yield
+
+
+def test_estimate_interval_clamps():
+    assert polling.estimate_interval(0) == polling.POLL_MAX_SECONDS
+    assert polling.estimate_interval(10**6) == polling.POLL_MIN_SECONDS
+    two_weeks = dt.timedelta(days=14)
+    assert polling.estimate_interval(14 * 24, two_weeks, 0.5, 60, 10**6) == 1800
+
+
+def test_learn_intervals_from_history():
+    intervals = polling.learn_intervals(["busy", "quiet", "silent", "unknown"])
+    assert intervals["busy"] == polling.POLL_MIN_SECONDS
+    assert polling.POLL_MIN_SECONDS < intervals["quiet"] <= polling.POLL_MAX_SECONDS
+    assert intervals["silent"] == intervals["unknown"] == polling.POLL_MAX_SECONDS
+
+
+def test_poller_orders_feeds_by_adaptive_interval(monkeypatch):
+    now = [0.0]
+    polled = []
+
+    async def poll(handles):
+        polled.append(sorted(handles))
+
+    async def fake_sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(polling.anyio, "sleep", fake_sleep)
+    poller = polling.AdaptivePoller(["busy", "quiet"], poll, clock=lambda: now[0])
+    anyio.run(lambda: poller.run(max_rounds=3))
+
+    # both start due, then busy comes round again before quiet does
+    assert polled == [["busy", "quiet"], ["busy"], ["busy"]]
+    assert now[0] == 2 * polling.POLL_MIN_SECONDS
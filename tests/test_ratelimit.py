@@ -0,0 +1,48 @@
+from apps.worker.ingestors.ratelimit import RateLimiter
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bursts_while_budget_is_plentiful():
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    limiter.update("tweets", {"x-rate-limit-limit": "100", "x-rate-limit-remaining": "90", "x-rate-limit-reset": "1900"})
+
+    assert [limiter.delay("tweets") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.budget()["tweets"]["remaining"] == 87
+
+
+def test_spreads_requests_when_budget_runs_low():
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    limiter.update("tweets", {"x-rate-limit-limit": "100", "x-rate-limit-remaining": "10", "x-rate-limit-reset": "1100"})
+
+    assert limiter.delay("tweets") == 0.0
+    # 100s left in the window shared across the 10 remaining requests
+    assert limiter.delay("tweets") == 10.0
+
+
+def test_exhausted_budget_waits_for_reset():
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    limiter.update("users", {"x-rate-limit-remaining": "0", "x-rate-limit-reset": "1060"})
+
+    assert limiter.delay("users") == 60.0
+
+
+def test_backoff_on_429_uses_reset_with_jitter():
+    clock = Clock()
+    limiter = RateLimiter(base_backoff=1.0, clock=clock)
+
+    wait = limiter.backoff("tweets", {"x-rate-limit-reset": "1030"}, attempt=0)
+    assert 30.0 <= wait <= 31.0
+    assert limiter.delay("tweets") >= 30.0
+
+    # without headers fall back to exponential backoff
+    assert 4.0 <= limiter.backoff("users", {}, attempt=2) <= 5.0
@@ -0,0 +1,156 @@
+import anyio
+import httpx
+import pytest
+from openai import BadRequestError, InternalServerError
+
+from apps.worker.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamGuard,
+)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def server_error() -> InternalServerError:
+    request = httpx.Request("POST", "http://fake/v1/chat/completions")
+    return InternalServerError("boom", response=httpx.Response(500, request=request), body=None)
+
+
+def bad_request() -> BadRequestError:
+    request = httpx.Request("POST", "http://fake/v1/chat/completions")
+    return BadRequestError("bad", response=httpx.Response(400, request=request), body=None)
+
+
+def test_limiter_grows_additively_and_halves_once_per_window():
+    clock = Clock()
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8, latency_target=1.0, clock=clock)
+
+    async def run():
+        for _ in range(4):
+            limiter.release(await limiter.acquire(), True)
+        assert 4.9 < limiter.limit < 5.0  # about one slot per round of successes
+
+        started = [await limiter.acquire() for _ in range(3)]
+        clock.now += 0.5
+        for s in started:
+            limiter.release(s, False)  # a burst of failures from the same window
+        assert limiter.limit == pytest.approx(4.9 / 2, abs=0.1)
+
+        slow = await limiter.acquire()
+        clock.now += 5
+        limiter.release(slow, True)  # slow success counts as congestion
+        assert limiter.limit < 2.5
+        assert limiter.in_flight == 0
+
+    anyio.run(run)
+
+
+def test_limiter_blocks_at_limit():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+    order = []
+
+    async def worker(name):
+        started = await limiter.acquire()
+        order.append(name)
+        await anyio.sleep(0.01)
+        limiter.release(started, None)
+
+    async def run():
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(worker, "a")
+            tg.start_soon(worker, "b")
+            await anyio.sleep(0.005)
+            assert order == ["a"]
+        assert order == ["a", "b"]
+
+    anyio.run(run)
+
+
+def test_breaker_opens_fails_fast_and_recovers_through_probe():
+    clock = Clock()
+    guard = UpstreamGuard(
+        AdaptiveLimiter(initial=4, clock=clock), CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=clock)
+    )
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        raise server_error()
+
+    async def succeeding():
+        nonlocal calls
+        calls += 1
+        return "ok"
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(InternalServerError):
+                await guard.call(failing)
+        assert guard.breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            await guard.call(succeeding)
+        assert calls == 2 and guard.rejected == 1
+
+        clock.now += 31
+        assert guard.breaker.allow() and guard.breaker.state == HALF_OPEN
+        assert not guard.breaker.allow()  # only one probe at a time
+        guard.breaker.release_probe()
+        assert await guard.call(succeeding) == "ok"
+        assert guard.breaker.state == CLOSED
+        assert guard.snapshot()["circuit"] == CLOSED
+
+    anyio.run(run)
+
+
+def test_client_errors_do_not_trip_breaker():
+    guard = UpstreamGuard(breaker=CircuitBreaker(failure_threshold=1))
+
+    async def invalid():
+        raise bad_request()
+
+    async def run():
+        with pytest.raises(BadRequestError):
+            await guard.call(invalid)
+        assert guard.breaker.state == CLOSED
+
+    anyio.run(run)
+
+
+def test_slow_replies_trip_breaker_but_are_served():
+    clock = Clock()
+    guard = UpstreamGuard(
+        AdaptiveLimiter(latency_target=1.0, clock=clock),
+        CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=clock),
+    )
+
+    async def slow():
+        clock.now += 5
+        return "late"
+
+    async def fast():
+        return "quick"
+
+    async def run():
+        assert await guard.call(slow) == "late"
+        assert guard.breaker.failures == 1 and guard.breaker.state == CLOSED
+        assert await guard.call(fast) == "quick"
+        assert guard.breaker.failures == 0
+        for _ in range(2):
+            await guard.call(slow)
+        assert guard.breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            await guard.call(fast)
+
+    anyio.run(run)
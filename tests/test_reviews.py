@@ -0,0 +1,182 @@
+import uuid
+
+import anyio
+import httpx
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, func, select
+
+from apps.worker import engine, reviews
+from apps.worker.bulk import flashcard_rows, insert_flashcards
+from apps.worker.main import app
+from packages.core.models import CardSchedule, Feed, Post, ReviewLog, User
+
+
+@pytest.fixture
+def card_ids():
+    """Two fresh cards scheduled for a new user; returns ``(user_id, [card ids])``."""
+    tag = uuid.uuid4().hex
+    with Session(engine) as ses:
+        user = User(email=f"{tag}@example.com")
+        feed = Feed(handle=f"reviews-{tag}")
+        ses.add_all([user, feed])
+        ses.flush()
+        post = Post(feed_id=feed.id, tweet_id=f"review-{tag}", text="t")
+        ses.add(post)
+        ses.flush()
+        cards = [{"question": "q1", "answer": "a"}, {"question": "q2", "answer": "a"}]
+        stored = insert_flashcards(ses, flashcard_rows(post.id, cards), (user.id,))
+        ses.commit()
+        return user.id, [r.id for r in stored]
+
+
+def write_behind(monkeypatch, **kwargs) -> reviews.ReviewBuffer:
+    buffer = reviews.ReviewBuffer(**{"flush_size": 100, "flush_seconds": 60, **kwargs})
+    monkeypatch.setattr(reviews, "REVIEW_WRITE_BEHIND", True)
+    monkeypatch.setattr(reviews, "buffer", buffer)
+    return buffer
+
+
+async def review(user_id: int, card_id: int, quality: int = 5) -> dict:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/review", json={"user_id": user_id, "flashcard_id": card_id, "quality": quality})
+        assert resp.status_code == 200
+        return resp.json()
+
+
+def stored(user_id: int, card_id: int) -> tuple[int, int]:
+    """``(repetitions, review log rows)`` in the database."""
+    with Session(engine) as ses:
+        sched = ses.get(CardSchedule, (user_id, card_id))
+        logged = ses.exec(
+            select(func.count()).select_from(ReviewLog).where(
+                ReviewLog.user_id == user_id, ReviewLog.flashcard_id == card_id
+            )
+        ).one()
+        return sched.repetitions, logged
+
+
+def test_direct_review_writes_schedule_and_log(card_ids):
+    user_id, (card, _) = card_ids
+    anyio.run(review, user_id, card)
+    assert stored(user_id, card) == (1, 1)
+
+
+def test_write_behind_answers_from_buffer_and_flushes_in_one_batch(monkeypatch, card_ids):
+    buffer = write_behind(monkeypatch)
+    user_id, (first, second) = card_ids
+
+    async def run():
+        assert (await review(user_id, first))["interval"] == 1
+        # the second review of the same card builds on the buffered state
+        assert (await review(user_id, first))["interval"] == 6
+        await review(user_id, second)
+        assert stored(user_id, first) == (0, 0) and len(buffer) == 3
+        assert await buffer.flush() == 3
+
+    anyio.run(run)
+    assert stored(user_id, first) == (2, 2) and stored(user_id, second) == (1, 1)
+    assert buffer.snapshot()["flushes"] == 1
+
+
+def test_write_behind_flushes_on_size(monkeypatch, card_ids):
+    buffer = write_behind(monkeypatch, flush_size=2)
+    user_id, (first, second) = card_ids
+
+    async def run():
+        await review(user_id, first)
+        assert len(buffer) == 1
+        await review(user_id, second)
+        assert len(buffer) == 0
+
+    anyio.run(run)
+    assert stored(user_id, first) == (1, 1)
+
+
+def test_group_durability_waits_for_commit(monkeypatch, card_ids):
+    buffer = write_behind(monkeypatch, durability="group")
+    user_id, (card, _) = card_ids
+    answered = []
+
+    async def reviewer():
+        answered.append(await review(user_id, card))
+
+    async def run():
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(reviewer)
+            await anyio.sleep(0.1)
+            assert not answered and len(buffer) == 1
+            await buffer.flush()
+        assert answered[0]["interval"] == 1
+
+    anyio.run(run)
+    assert stored(user_id, card) == (1, 1)
+
+
+def test_failed_flush_keeps_reviews_for_the_next_one(monkeypatch, card_ids):
+    buffer = write_behind(monkeypatch)
+    user_id, (card, _) = card_ids
+    real_maker = reviews.async_session_maker
+
+    def broken():
+        raise OperationalError("flush", {}, Exception("database is down"))
+
+    async def run():
+        await review(user_id, card)
+        monkeypatch.setattr(reviews, "async_session_maker", broken)
+        assert await buffer.flush() == 0
+        await review(user_id, card)  # still sees the unwritten first review
+        monkeypatch.setattr(reviews, "async_session_maker", real_maker)
+        assert await buffer.flush() == 2
+
+    anyio.run(run)
+    assert stored(user_id, card) == (2, 2)
+
+
+def test_group_durability_survives_a_failed_flush(monkeypatch, card_ids):
+    # size 1: the review's own flush fails before anything waits on its batch
+    buffer = write_behind(monkeypatch, durability="group", flush_size=1)
+    user_id, (card, _) = card_ids
+    real_maker = reviews.async_session_maker
+    answered = []
+
+    def broken():
+        monkeypatch.setattr(reviews, "async_session_maker", real_maker)
+        raise OperationalError("flush", {}, Exception("database is down"))
+
+    async def reviewer():
+        answered.append(await review(user_id, card))
+
+    async def run():
+        monkeypatch.setattr(reviews, "async_session_maker", broken)
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(reviewer)
+            await anyio.sleep(0.1)
+            assert not answered and len(buffer) == 1
+            with anyio.fail_after(5):
+                assert await buffer.flush() == 1
+                while not answered:
+                    await anyio.sleep(0.01)
+        assert answered[0]["interval"] == 1
+
+    anyio.run(run)
+    assert stored(user_id, card) == (1, 1)
+
+
+def test_shutdown_flushes_buffered_reviews(monkeypatch, card_ids):
+    buffer = write_behind(monkeypatch)
+    user_id, (card, _) = card_ids
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            await review(user_id, card)
+            assert len(buffer) == 1
+        assert len(buffer) == 0
+
+    anyio.run(run)
+    assert stored(user_id, card) == (1, 1)
+
+
+def test_unknown_durability_is_rejected():
+    with pytest.raises(ValueError):
+        reviews.ReviewBuffer(durability="sometimes")
@@ -0,0 +1,33 @@
+import random
+
+from packages.core.simhash import SimHashIndex, hamming, simhash, to_signed, to_unsigned
+
+
+def test_simhash_is_stable_and_similarity_preserving():
+    a = simhash("Gemini 2.0 is rolling out to everyone today in the Gemini app")
+    b = simhash("Gemini 2.0 is rolling out to everyone today in the Gemini app!")
+    c = simhash("We published a paper on protein folding with a new benchmark")
+
+    assert a == simhash("Gemini 2.0 is rolling out to everyone today in the Gemini app")
+    assert hamming(a, b) <= 3
+    assert hamming(a, c) > 10
+
+
+def test_signed_round_trip():
+    for value in (0, 1, 2**63 - 1, 2**63, 2**64 - 1):
+        signed = to_signed(value)
+        assert -(2**63) <= signed < 2**63
+        assert to_unsigned(signed) == value
+
+
+def test_index_finds_neighbours_within_distance():
+    rng = random.Random(7)
+    index: SimHashIndex[int] = SimHashIndex(max_distance=3)
+    base = [rng.getrandbits(64) for _ in range(200)]
+    index.update((fp, i) for i, fp in enumerate(base))
+
+    flipped = base[42] ^ (1 << 3) ^ (1 << 40) ^ (1 << 63)
+    assert index.query(flipped) == 42
+    assert index.query(to_signed(flipped)) == 42
+    assert index.query(base[42] ^ 0b1111) is None
+    assert len(index) == 200
@@ -0,0 +1,59 @@
+import types
+
+import anyio
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from apps.worker import llm, telemetry
+from packages.core.models import LLMCall
+
+
+class UsageClient:
+    def __init__(self) -> None:
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        await anyio.sleep(0.01)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="ok"))],
+            usage=types.SimpleNamespace(prompt_tokens=1000, completion_tokens=500),
+        )
+
+
+def test_complete_records_usage_status_and_pipeline(monkeypatch):
+    monkeypatch.setattr(llm, "cache", llm.LLMCache())
+    monkeypatch.setattr(telemetry, "calls", telemetry.Telemetry())
+    client = UsageClient()
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def run():
+        await llm.complete(client, "gpt-3.5-turbo", messages, pipeline="summarise", max_tokens=128)
+        await llm.complete(client, "gpt-3.5-turbo", messages, pipeline="summarise", max_tokens=128)
+
+    anyio.run(run)
+    first, second = telemetry.calls.records
+    assert (first.status, first.prompt_tokens, first.completion_tokens, first.max_tokens) == ("upstream", 1000, 500, 128)
+    assert first.latency_ms >= 10
+    assert second.status == "memory" and second.prompt_tokens is None
+
+    (group,) = telemetry.calls.summary()["groups"]
+    assert group["pipeline"] == "summarise" and group["calls"] == 2
+    assert group["statuses"] == {"upstream": 1, "memory": 1}
+    assert group["cost_usd"] == 0.0005 + 0.00075  # cache hit is free
+    assert group["max_completion_tokens"] == 500
+
+
+def test_records_flushed_to_db_in_batches(monkeypatch):
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(telemetry, "engine", engine)
+    calls = telemetry.Telemetry(persist=True, flush_size=3)
+    for i in range(4):
+        calls.record(telemetry.CallRecord("flashcards", "gpt-3.5-turbo", "upstream", latency_ms=100.0 * i))
+
+    with Session(engine) as ses:
+        assert len(ses.exec(select(LLMCall)).all()) == 3
+    assert calls.flush() == 1
+    with Session(engine) as ses:
+        rows = ses.exec(select(LLMCall).order_by(LLMCall.latency_ms)).all()
+    assert [r.latency_ms for r in rows] == [0.0, 100.0, 200.0, 300.0]
+    assert calls.summary(slowest=1)["slowest"][0]["latency_ms"] == 300.0
@@ -3,8 +3,10 @@ from sqlmodel import Session, select, create_engine
 
 from apps import worker
 from apps.worker.ingestors import twitter
+from apps.worker.ingestors.ratelimit import RateLimiter
+from apps.worker.pipelines import jobs
 from apps.worker import init_db
-from packages.core.models import Post, Flashcard
+from packages.core.models import Feed, Post, Flashcard
 from apps.worker.main import SummaryOut, FlashcardsOut, Flashcard as CardSchema
 
 
@@ -12,7 +14,12 @@ from apps.worker.main import SummaryOut, FlashcardsOut, Flashcard as CardSchema
 def setup_db(monkeypatch):
     test_engine = create_engine("sqlite:///:memory:")
     monkeypatch.setattr(twitter, "engine", test_engine)
+    monkeypatch.setattr(jobs, "engine", test_engine)
     monkeypatch.setattr(worker, "engine", test_engine)
+    monkeypatch.setattr(twitter, "_user_ids", {})
+    monkeypatch.setattr(twitter.dedup, "_index", None)
+    monkeypatch.setattr(twitter.dedup, "stats", twitter.dedup.DedupStats())
+    monkeypatch.setattr(twitter, "rate_limiter", RateLimiter(base_backoff=0.01))
     init_db()
     yield
 
@@ -23,6 +30,7 @@ def mock_network(monkeypatch):
         def __init__(self, data):
             self._data = data
             self.status_code = 200
+            self.headers = {}
 
         def raise_for_status(self):
             pass
@@ -37,19 +45,21 @@ def mock_network(monkeypatch):
 
     monkeypatch.setattr(twitter.httpx.AsyncClient, "get", fake_get, raising=False)
     
-    async def fake_summarise(payload):
+    async def fake_summarise(payload, pipeline):
         return SummaryOut(summary=payload.text)
 
-    async def fake_flashcards(payload):
+    async def fake_flashcards(payload, pipeline):
         return FlashcardsOut(flashcards=[CardSchema(question="q", answer="a")])
 
-    monkeypatch.setattr(twitter, "summarise", fake_summarise)
-    monkeypatch.setattr(twitter, "generate_flashcards", fake_flashcards)
+    monkeypatch.setattr(jobs, "summarise", fake_summarise)
+    monkeypatch.setattr(jobs, "generate_cards", fake_flashcards)
     yield
 
 
 def test_ingest_handles():
     twitter.ingest_handles(["testuser"])
+    # ingestion only queues work, the LLM consumers create the cards
+    assert twitter.anyio.run(lambda: jobs.run_consumers(drain=True)) == 1
 
     with Session(twitter.engine) as ses:
         posts = ses.exec(select(Post)).all()
@@ -57,3 +67,247 @@ def test_ingest_handles():
 
     assert len(posts) == 1
     assert len(cards) == 1
+
+
+def test_ingest_handles_concurrent_reports_stats(monkeypatch):
+    clients = set()
+    in_flight = 0
+    peak = 0
+
+    async def fake_fetch(handle, since_id=None, client=None):
+        nonlocal in_flight, peak
+        clients.add(id(client))
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await twitter.anyio.sleep(0.01)
+        in_flight -= 1
+        return [{"id": f"{handle}-1", "text": f"hello from {handle}"}]
+
+    monkeypatch.setattr(twitter, "fetch_latest", fake_fetch)
+    stats = twitter.ingest_handles(["a", "b", "c", "d", "e"])
+
+    assert [s.handle for s in stats] == ["a", "b", "c", "d", "e"]
+    assert all(s.new_posts == 1 and s.error is None and s.seconds > 0 for s in stats)
+    assert len(clients) == 1
+    assert 1 < peak <= twitter.INGEST_CONCURRENCY
+
+
+def test_user_id_resolved_once_and_persisted(monkeypatch):
+    lookups = []
+    real_get = twitter.httpx.AsyncClient.get
+
+    async def counting_get(self, url, **kwargs):
+        if "users/by/username" in url:
+            lookups.append(url)
+        return await real_get(self, url, **kwargs)
+
+    monkeypatch.setattr(twitter.httpx.AsyncClient, "get", counting_get)
+    twitter.ingest_handles(["testuser"])
+    twitter.ingest_handles(["testuser"])
+    assert len(lookups) == 1
+
+    with Session(twitter.engine) as ses:
+        feed = ses.exec(select(Feed).where(Feed.handle == "testuser")).one()
+    assert feed.user_id == "1"
+    assert feed.user_id_resolved_at is not None
+
+    # a fresh process is seeded from the feed row instead of the API
+    twitter._user_ids.clear()
+    twitter.ingest_handles(["testuser"])
+    assert len(lookups) == 1
+
+
+def test_stale_user_id_refreshed_on_404(monkeypatch):
+    class Resp:
+        def __init__(self, status, data):
+            self.status_code = status
+            self._data = data
+            self.headers = {}
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise AssertionError("unexpected error status")
+
+        def json(self):
+            return self._data
+
+    async def fake_get(self, url, params=None, **kwargs):
+        if "users/by/username" in url:
+            return Resp(200, {"data": {"id": "2"}})
+        if "/users/1/" in url:
+            return Resp(404, {})
+        return Resp(200, {"data": [{"id": "11", "text": "moved"}]})
+
+    monkeypatch.setattr(twitter.httpx.AsyncClient, "get", fake_get)
+    twitter.remember_user_id("testuser", "1")
+    tweets = twitter.anyio.run(twitter.fetch_latest, "testuser")
+    assert tweets == [{"id": "11", "text": "moved"}]
+    assert twitter.cached_user_id("testuser")[0] == "2"
+
+
+def test_rate_limited_request_backs_off_and_retries(monkeypatch):
+    calls = []
+
+    class Resp:
+        def __init__(self, status, data, headers):
+            self.status_code = status
+            self._data = data
+            self.headers = headers
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self._data
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(url)
+        if "users/by/username" in url:
+            return Resp(200, {"data": {"id": "1"}}, {})
+        if len(calls) == 2:
+            return Resp(429, {}, {"x-rate-limit-remaining": "0"})
+        return Resp(
+            200,
+            {"data": [{"id": "10", "text": "hello world"}]},
+            {"x-rate-limit-limit": "900", "x-rate-limit-remaining": "899"},
+        )
+
+    monkeypatch.setattr(twitter.httpx.AsyncClient, "get", fake_get)
+    [stats] = twitter.ingest_handles(["testuser"])
+
+    assert stats.error is None and stats.new_posts == 1
+    assert len(calls) == 3
+    budget = twitter.rate_limiter.budget()["tweets"]
+    assert budget["limit"] == 900 and budget["remaining"] == 899
+
+
+def test_store_tweets_is_set_based():
+    from sqlalchemy import event
+
+    with Session(twitter.engine) as ses:
+        feed = twitter._ensure_feed(ses, "testuser")
+        feed_id = feed.id
+    twitter._store_tweets(feed_id, [{"id": "5", "text": "old"}])
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(twitter.engine, "before_cursor_execute", record)
+    tweets = [{"id": str(i), "text": f"t{i}"} for i in range(3, 40)]
+    new = twitter._store_tweets(feed_id, tweets)
+    event.remove(twitter.engine, "before_cursor_execute", record)
+
+    assert sorted(p.tweet_id for p in new) == sorted(str(i) for i in range(3, 40) if i != 5)
+    assert len(statements) <= 6  # load feed, existing ids, insert posts, enqueue jobs, mark queued, update feed
+    with Session(twitter.engine) as ses:
+        assert ses.get(Feed, feed_id).last_post_id == "39"
+        assert len(ses.exec(select(Post)).all()) == 37
+
+
+def test_backfill_pages_and_resumes_from_checkpoint(monkeypatch):
+    pages = {
+        None: ([{"id": "30", "text": "c"}, {"id": "29", "text": "b"}], "p2"),
+        "p2": ([{"id": "20", "text": "a"}], "p3"),
+        "p3": ([{"id": "10", "text": "z"}], None),
+    }
+    requested = []
+    fail_on = {"p3"}
+
+    class Resp:
+        status_code = 200
+        headers = {}
+
+        def __init__(self, data):
+            self._data = data
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self._data
+
+    async def fake_get(self, url, params=None, **kwargs):
+        if "users/by/username" in url:
+            return Resp({"data": {"id": "1"}})
+        token = params.get("pagination_token")
+        requested.append((token, params["max_results"]))
+        if token in fail_on:
+            fail_on.discard(token)
+            raise twitter.httpx.ConnectError("outage")
+        data, next_token = pages[token]
+        return Resp({"data": data, "meta": {"next_token": next_token} if next_token else {}})
+
+    monkeypatch.setattr(twitter.httpx.AsyncClient, "get", fake_get)
+
+    [stats] = twitter.anyio.run(lambda: twitter.ingest_handles_async(["testuser"], backfill=True))
+    assert stats.error is not None and stats.new_posts == 3
+    with Session(twitter.engine) as ses:
+        feed = ses.exec(select(Feed).where(Feed.handle == "testuser")).one()
+        assert feed.backfill_token == "p3" and feed.backfilled_at is None
+        assert feed.last_post_id == "30"
+
+    # a plain pass picks the interrupted backfill back up at the checkpoint
+    [stats] = twitter.ingest_handles(["testuser"])
+    assert stats.error is None and stats.new_posts == 1
+    assert requested[-1] == ("p3", "100")
+    with Session(twitter.engine) as ses:
+        feed = ses.exec(select(Feed).where(Feed.handle == "testuser")).one()
+        assert feed.backfill_token is None and feed.backfilled_at is not None
+        assert len(ses.exec(select(Post)).all()) == 4
+
+
+def test_posts_keep_tweet_timestamp():
+    import datetime as dt
+
+    with Session(twitter.engine) as ses:
+        feed_id = twitter._ensure_feed(ses, "testuser").id
+    [post] = twitter._store_tweets(feed_id, [{"id": "7", "text": "t", "created_at": "2024-05-01T12:30:00.000Z"}])
+    assert post.created_at == dt.datetime(2024, 5, 1, 12, 30)
+
+
+def test_near_duplicate_posts_skip_the_llm(monkeypatch):
+    texts = {
+        "openai": "Introducing GPT-5, our most capable model yet, available today in the API https://t.co/abc",
+        "googleai": "Introducing GPT-5, our most capable model yet, available today in the API! https://t.co/xyz",
+        "other": "A completely different note about spaced repetition and flashcards",
+    }
+
+    async def fake_fetch(handle, since_id=None, client=None):
+        return [{"id": str(len(handle)) + handle, "text": texts[handle]}]
+
+    monkeypatch.setattr(twitter, "fetch_latest", fake_fetch)
+    twitter.ingest_handles(["openai"])
+    stats = twitter.ingest_handles(["googleai", "other"])
+
+    assert [s.duplicates for s in stats] == [1, 0]
+    assert twitter.dedup.stats.skipped_calls == 2
+    with Session(twitter.engine) as ses:
+        posts = {p.text: p for p in ses.exec(select(Post)).all()}
+        queued = {j.post_id for j in ses.exec(select(jobs.PostJob)).all()}
+    original = posts[texts["openai"]]
+    assert posts[texts["googleai"]].duplicate_of_id == original.id
+    assert posts[texts["googleai"]].processing_state == "duplicate"
+    assert queued == {original.id, posts[texts["other"]].id}
+
+
+def test_rolled_back_posts_are_not_dedup_originals(monkeypatch):
+    text = "Introducing GPT-5, our most capable model yet, available today in the API https://t.co/abc"
+    with Session(twitter.engine) as ses:
+        feed_id = twitter._ensure_feed(ses, "testuser").id
+    twitter._store_tweets(feed_id, [{"id": "1", "text": "warm the index"}])
+
+    def fail_commit(self):
+        raise RuntimeError("commit failed")
+
+    with monkeypatch.context() as m:
+        m.setattr(twitter.Session, "commit", fail_commit)
+        with pytest.raises(RuntimeError):
+            twitter._store_tweets(feed_id, [{"id": "2", "text": text}])
+
+    # the rolled-back id is handed out again, to an unrelated post
+    filler, post = twitter._store_tweets(feed_id, [{"id": "3", "text": "filler"}, {"id": "4", "text": text + "!"}])
+    assert post.duplicate_of_id is None
+    with Session(twitter.engine) as ses:
+        assert {j.post_id for j in ses.exec(select(jobs.PostJob)).all()} == {1, filler.id, post.id}
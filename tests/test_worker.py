@@ -1,11 +1,11 @@
 import json
 import httpx
 from openai import APIError
-import os
 import anyio
+import datetime as dt
 
-os.environ["DATABASE_URL"] = "sqlite://"
 from apps.worker.main import app, client as openai_client
+from apps.worker import llm, resilience, telemetry
 import types
 import pytest
 
@@ -24,6 +24,8 @@ def mock_openai(monkeypatch):
         return dummy
 
     monkeypatch.setattr(openai_client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(llm, "cache", llm.LLMCache())
+    monkeypatch.setattr(resilience, "guard", resilience.UpstreamGuard())
     yield
 
 
@@ -75,3 +77,250 @@ def test_flashcards_route_schema():
             assert set(card) == {"id", "question", "answer"}
 
     anyio.run(run)
+
+
+def test_flashcards_stream_route(monkeypatch):
+    """Cards are emitted as NDJSON lines while the completion streams in."""
+    pieces = ['[{"question":"Q1",', '"answer":"A1"},', '{"question":"Q2","answer":"A2"}]']
+
+    async def fake_stream():
+        for piece in pieces:
+            yield types.SimpleNamespace(
+                choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=piece))]
+            )
+
+    async def fake_create(*args, **kwargs):
+        assert kwargs["stream"] is True
+        return fake_stream()
+
+    monkeypatch.setattr(openai_client.chat.completions, "create", fake_create)
+
+    async def run():
+        resp = await request("POST", "/flashcards/stream", json={"text": "streaming"})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        cards = [json.loads(line) for line in resp.text.splitlines()]
+        assert [(c["question"], c["answer"]) for c in cards] == [("Q1", "A1"), ("Q2", "A2")]
+        assert all(isinstance(c["id"], int) for c in cards)
+
+    anyio.run(run)
+
+
+def test_flashcards_stream_failure_counts_against_the_breaker(monkeypatch):
+    async def broken_stream():
+        yield types.SimpleNamespace(
+            choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content='[{"question":"Q1",'))]
+        )
+        raise APIError("dropped", request=None, body=None)
+
+    async def fake_create(*args, **kwargs):
+        return broken_stream()
+
+    monkeypatch.setattr(openai_client.chat.completions, "create", fake_create)
+
+    async def run():
+        resp = await request("POST", "/flashcards/stream", json={"text": "streaming"})
+        assert resp.status_code == 200
+        assert json.loads(resp.text.splitlines()[-1]) == {"error": "OpenAI error"}
+
+    anyio.run(run)
+    assert resilience.guard.breaker.failures == 1
+
+
+def test_open_circuit_fails_fast(monkeypatch):
+    calls = 0
+
+    async def counting_create(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+
+    monkeypatch.setattr(openai_client.chat.completions, "create", counting_create)
+    breaker = resilience.guard.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record(False)
+
+    async def run():
+        resp = await request("POST", "/summarise", json={"text": "hi"})
+        assert resp.status_code == 502
+        health = (await request("GET", "/health")).json()
+        assert health["status"] == "degraded"
+        assert health["openai"]["circuit"] == "open"
+        assert health["openai"]["rejected"] == 1
+
+    anyio.run(run)
+    assert calls == 0
+
+
+def test_flashcards_route_accepts_wrapped_truncated_reply(monkeypatch):
+    async def wrapped_create(*args, **kwargs):
+        content = '{"flashcards": [{"question": "Q1", "answer": "A1"}, {"question": "Q2", "ans'
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(openai_client.chat.completions, "create", wrapped_create)
+
+    async def run():
+        resp = await request("POST", "/flashcards", json={"text": "wrapped"})
+        assert resp.status_code == 200
+        assert [c["question"] for c in resp.json()["flashcards"]] == ["Q1"]
+
+    anyio.run(run)
+
+
+def test_llm_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(telemetry, "calls", telemetry.Telemetry())
+
+    async def run():
+        await request("POST", "/summarise", json={"text": "metrics"})
+        resp = await request("GET", "/metrics/llm")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert [g["pipeline"] for g in data["groups"]] == ["summarise"]
+        assert {"parse", "cache", "slowest"} <= set(data)
+
+    anyio.run(run)
+
+
+def test_unparseable_reply_is_not_replayed_from_cache(monkeypatch):
+    replies = ["not json", '{"flashcards": [{"question": "Q", "answer": "A"}]}']
+
+    async def fake_create(*args, **kwargs):
+        content = replies.pop(0)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(openai_client.chat.completions, "create", fake_create)
+
+    async def run():
+        bad = await request("POST", "/flashcards", json={"text": "retry me"})
+        assert bad.status_code == 502
+        good = await request("POST", "/flashcards", json={"text": "retry me"})
+        assert good.status_code == 200
+        assert [c["question"] for c in good.json()["flashcards"]] == ["Q"]
+
+    anyio.run(run)
+    assert replies == []  # the retry reached the model
+
+
+def test_deck_and_review_round_trip():
+    async def run():
+        created = (await request("POST", "/flashcards", json={"text": "review me"})).json()["flashcards"]
+        card_id = created[0]["id"]
+        deck = (await request("GET", "/deck/today")).json()["flashcards"]
+        assert card_id in [c["id"] for c in deck]
+
+        resp = await request("POST", "/review", json={"flashcard_id": card_id, "quality": 5})
+        assert resp.status_code == 200
+        body = resp.json()
+        assert body["interval"] == 1
+        assert body["next_review"] == str(dt.date.today() + dt.timedelta(days=1))
+        deck = (await request("GET", "/deck/today")).json()["flashcards"]
+        assert card_id not in [c["id"] for c in deck]
+
+        missing = await request("POST", "/review", json={"flashcard_id": 10**9, "quality": 3})
+        assert missing.status_code == 404
+
+    anyio.run(run)
+
+
+def test_deck_pages_most_overdue_first():
+    from sqlmodel import Session
+
+    from apps.worker import engine
+    from packages.core.models import CardSchedule, Feed, Flashcard as DBFlashcard, Post, User
+
+    today = dt.date.today()
+    with Session(engine) as ses:
+        user = User(email="pager@example.com")
+        feed = Feed(handle="pager")
+        ses.add_all([user, feed])
+        ses.flush()
+        post = Post(feed_id=feed.id, tweet_id="pager-1", text="t")
+        ses.add(post)
+        ses.flush()
+        overdue = [3, 1, 3, 0, 2, -1]  # days overdue; the last card is not yet due
+        cards = [DBFlashcard(post_id=post.id, question=f"q{i}", answer="a") for i in range(len(overdue))]
+        ses.add_all(cards)
+        ses.flush()
+        ses.add_all(
+            CardSchedule(user_id=user.id, flashcard_id=c.id, next_review=today - dt.timedelta(days=d))
+            for c, d in zip(cards, overdue)
+        )
+        ses.commit()
+        user_id = user.id
+
+    async def run():
+        seen, cursor = [], None
+        while True:
+            params = {"user_id": user_id, "limit": 2, **({"cursor": cursor} if cursor else {})}
+            data = (await request("GET", "/deck/today", params=params)).json()
+            seen += [c["question"] for c in data["flashcards"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == ["q0", "q2", "q4", "q1", "q3"]
+        bad = await request("GET", "/deck/today", params={"cursor": "nope"})
+        assert bad.status_code == 400
+
+    anyio.run(run)
+
+
+def test_card_content_is_shared_and_schedules_are_per_user():
+    from sqlmodel import Session, func, select
+
+    from apps.worker import engine
+    from apps.worker.bulk import flashcard_rows, insert_flashcards
+    from packages.core.models import CardSchedule, Feed, Flashcard as DBFlashcard, Post, User
+
+    with Session(engine) as ses:
+        users = [User(email="a@shared.example"), User(email="b@shared.example")]
+        feed = Feed(handle="shared")
+        ses.add_all([*users, feed])
+        ses.flush()
+        post = Post(feed_id=feed.id, tweet_id="shared-1", text="t")
+        ses.add(post)
+        ses.flush()
+        [card] = insert_flashcards(
+            ses, flashcard_rows(post.id, [{"question": "shared", "answer": "a"}]), tuple(u.id for u in users)
+        )
+        ses.commit()
+        a, b = (u.id for u in users)
+        assert ses.exec(select(func.count()).select_from(DBFlashcard).where(DBFlashcard.post_id == post.id)).one() == 1
+
+    async def run():
+        resp = await request("POST", "/review", json={"flashcard_id": card.id, "user_id": b, "quality": 5})
+        assert resp.status_code == 200
+        deck_a = (await request("GET", "/deck/today", params={"user_id": a})).json()["flashcards"]
+        deck_b = (await request("GET", "/deck/today", params={"user_id": b})).json()["flashcards"]
+        assert [c["question"] for c in deck_a] == ["shared"] and deck_b == []
+
+    anyio.run(run)
+    with Session(engine) as ses:
+        assert ses.get(CardSchedule, (a, card.id)).repetitions == 0
+        assert ses.get(CardSchedule, (b, card.id)).repetitions == 1
+
+
+def test_flashcards_written_in_one_insert(monkeypatch):
+    from sqlalchemy import event
+
+    from packages.db import engine as async_engine
+
+    async def five_cards(*args, **kwargs):
+        content = json.dumps({"flashcards": [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(5)]})
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(openai_client.chat.completions, "create", five_cards)
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement.split()[0].upper())
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        async def run():
+            resp = await request("POST", "/flashcards", json={"text": "bulk"})
+            assert [c["question"] for c in resp.json()["flashcards"]] == [f"Q{i}" for i in range(5)]
+            assert len({c["id"] for c in resp.json()["flashcards"]}) == 5
+
+        anyio.run(run)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert statements == ["INSERT", "INSERT", "INSERT"]  # the post, all cards, all schedules